@@ -21,7 +21,7 @@ class BgRewriteAofCommand(Command):
 class GetCommand(Command):
     async def execute(self, context, *args):
         if len(args) != 1: raise ValueError("ERR wrong number of arguments for 'get' command")
-        return await context.storage.get(args[0])
+        return context.storage.get(args[0])
 
 @CommandRegistry.register('SET')
 class SetCommand(Command):
@@ -35,19 +35,19 @@ class SetCommand(Command):
             except ValueError:
                 pass 
         
-        return await context.storage.set(key, value, expire)
+        return context.storage.set(key, value, expire)
 
 @CommandRegistry.register('DELETE')
 class DeleteCommand(Command):
     async def execute(self, context, *args):
         if len(args) != 1: raise ValueError("ERR wrong number of arguments for 'delete' command")
-        return await context.storage.delete(args[0])
+        return context.storage.delete(args[0])
 
 @CommandRegistry.register('EXPIRE')
 class ExpireCommand(Command):
     async def execute(self, context, *args):
         if len(args) != 2: raise ValueError("ERR wrong number of arguments for 'expire' command")
-        return await context.storage.expire(args[0], int(args[1]))
+        return context.storage.expire(args[0], int(args[1]))
 
 @CommandRegistry.register('LPUSH')
 class LPushCommand(Command):
@@ -55,43 +55,49 @@ class LPushCommand(Command):
         if len(args) < 2: raise ValueError("ERR wrong number of arguments for 'lpush' command")
         key = args[0]
         values = list(args[1:])
-        return await context.storage.lpush(key, values)
+        return context.storage.lpush(key, values)
 
 @CommandRegistry.register('LRANGE')
 class LRangeCommand(Command):
     async def execute(self, context, *args):
         if len(args) != 3: raise ValueError("ERR wrong number of arguments for 'lrange' command")
-        return await context.storage.lrange(args[0], int(args[1]), int(args[2]))
+        return context.storage.lrange(args[0], int(args[1]), int(args[2]))
 
 @CommandRegistry.register('HSET')
 class HSetCommand(Command):
     async def execute(self, context, *args):
         if len(args) != 3: raise ValueError("ERR wrong number of arguments for 'hset' command")
-        return await context.storage.hset(args[0], args[1], args[2])
+        return context.storage.hset(args[0], args[1], args[2])
 
 @CommandRegistry.register('HGET')
 class HGetCommand(Command):
     async def execute(self, context, *args):
         if len(args) != 2: raise ValueError("ERR wrong number of arguments for 'hget' command")
-        return await context.storage.hget(args[0], args[1])
+        return context.storage.hget(args[0], args[1])
+
+@CommandRegistry.register('HMGET')
+class HMGetCommand(Command):
+    async def execute(self, context, *args):
+        if len(args) < 2: raise ValueError("ERR wrong number of arguments for 'hmget' command")
+        return context.storage.hmget(args[0], list(args[1:]))
 
 @CommandRegistry.register('SADD')
 class SAddCommand(Command):
     async def execute(self, context, *args):
         if len(args) < 2: raise ValueError("ERR wrong number of arguments for 'sadd' command")
-        return await context.storage.sadd(args[0], list(args[1:]))
+        return context.storage.sadd(args[0], list(args[1:]))
 
 @CommandRegistry.register('SREM')
 class SRemCommand(Command):
     async def execute(self, context, *args):
         if len(args) < 2: raise ValueError("ERR wrong number of arguments for 'srem' command")
-        return await context.storage.srem(args[0], list(args[1:]))
+        return context.storage.srem(args[0], list(args[1:]))
 
 @CommandRegistry.register('SMEMBERS')
 class SMembersCommand(Command):
     async def execute(self, context, *args):
         if len(args) != 1: raise ValueError("ERR wrong number of arguments for 'smembers' command")
-        return await context.storage.smembers(args[0])
+        return context.storage.smembers(args[0])
 
 @CommandRegistry.register('PUBLISH')
 class PublishCommand(Command):
@@ -169,7 +175,7 @@ class SetBlobCommand(Command):
         else:
             encoded = raw_b64  # Fallback: store as-is
         
-        return await context.storage.set(key, encoded, expire)
+        return context.storage.set(key, encoded, expire)
 
 @CommandRegistry.register('GETBLOB')
 class GetBlobCommand(Command):
@@ -181,7 +187,7 @@ class GetBlobCommand(Command):
         Automatically reverses compress/encrypt based on stored header byte.
         """
         if len(args) != 1: raise ValueError("ERR wrong number of arguments for 'getblob' command")
-        stored = await context.storage.get(args[0])
+        stored = context.storage.get(args[0])
         
         if stored is None:
             return None
@@ -49,6 +49,7 @@ class MySQLProtocolHandler:
                 
                 command = packet[0]
                 payload = packet[1:]
+                self.storage.refresh_clock()
                 
                 if command == COM_QUIT:
                     break
@@ -100,7 +101,7 @@ class MySQLProtocolHandler:
                          return
 
                     key = f"{table}:{val}"
-                    data = await self.storage.get(key)
+                    data = self.storage.get(key)
                     
                     if data:
                         try:
@@ -149,7 +150,7 @@ class MySQLProtocolHandler:
                         key = f"{table}:{id_val}"
                         
                         # Store as JSON
-                        await self.storage.set(key, json.dumps(row_data))
+                        self.storage.set(key, json.dumps(row_data))
                         self.send_ok_packet()
                     else:
                         self.send_err_packet(1064, "Parse error in INSERT")
@@ -168,7 +169,7 @@ class MySQLProtocolHandler:
                     key = f"{table}:{id_val}"
                     
                     # 1. Get existing
-                    existing_data = await self.storage.get(key)
+                    existing_data = self.storage.get(key)
                     if not existing_data:
                         # MySQL returns OK with 0 affected rows if not found
                         self.send_ok_packet() 
@@ -192,7 +193,7 @@ class MySQLProtocolHandler:
                                 current_row[col] = val
                         
                         # 3. Save back
-                        await self.storage.set(key, json.dumps(current_row))
+                        self.storage.set(key, json.dumps(current_row))
                         self.send_ok_packet()
                     else:
                         self.send_err_packet(1064, "Parse error in UPDATE (SET clause)")
@@ -207,7 +208,7 @@ class MySQLProtocolHandler:
                     table, id_val = match.groups()
                     key = f"{table}:{id_val}"
                     
-                    deleted = await self.storage.delete(key)
+                    deleted = self.storage.delete(key)
                     # Send OK with affected rows? Packet doesn't strictly require it for simple OK
                     self.send_ok_packet() 
                 else:
@@ -4,44 +4,97 @@ import logging
 import asyncio
 import time
 import base64
+from collections import deque
 from typing import List, Tuple, Any, Dict, Optional
+from .protocol import encode_command_into
+
+# orjson is an optional, much faster JSON encoder for snapshots.
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# fdatasync skips flushing unchanged metadata; platforms without it fall back to fsync.
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+def _write_all(fd: int, data) -> None:
+    """Writes all of `data` to a raw descriptor, looping over partial writes."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+# A batch this large is flushed right away instead of waiting for the next interval.
+AOF_FLUSH_BYTES = 64 * 1024
+
+def _flush_to_disk(fd: int, batch) -> None:
+    """Writes and syncs one AOF batch; runs in an executor thread."""
+    try:
+        _write_all(fd, batch)
+        _fdatasync(fd)
+    except Exception as e:
+        logger.error(f"Error flushing AOF: {e}")
+
 class AofHandler:
-    """Manages writing commands to the AOF file for persistence."""
+    """
+    Manages writing commands to the AOF file for persistence.
+    Commands are buffered as bytes and written + synced once per flush interval
+    (like Redis' "appendfsync everysec") instead of flushing after every line.
+    A burst that fills AOF_FLUSH_BYTES is flushed early, one write per batch.
+    Only one flush runs at a time so batches reach the file in order, and the
+    descriptor is only closed or replaced once that flush has finished with it.
+    """
     def __init__(self, path: str, flush_interval: float = 1.0):
         self._path = path
-        self._file = None
-        self._buffer = []
+        self._fd: Optional[int] = None
+        self._buffer = bytearray()
         self._flush_interval = flush_interval
         self._running = False
         self._flush_task = None
+        # Executor future of the flush in flight, if any.
+        self._flush_future = None
+        self._early_flush = None
+        self._loop = None
 
     def open(self):
         """Opens the AOF file in append mode and starts background flusher."""
         try:
-            self._file = open(self._path, 'a', buffering=1, encoding='utf-8')
+            self._fd = self._open_fd()
             self._running = True
-            loop = asyncio.get_event_loop()
-            self._flush_task = loop.create_task(self._periodic_flush())
+            self._loop = asyncio.get_event_loop()
+            self._flush_task = self._loop.create_task(self._periodic_flush())
             logger.info(f"AOF file '{self._path}' opened for writing (Async Mode).")
         except Exception as e:
             logger.error(f"Failed to open AOF file: {e}")
             raise
 
+    def _open_fd(self) -> int:
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        return os.open(self._path, flags, 0o644)
+
     def write(self, command: str, *args: Any):
         """Buffers a command to be written to the AOF file."""
         if not self._running:
             return
         
-        parts = [f"*{len(args) + 1}\r\n", f"${len(command)}\r\n{command}\r\n"]
-        for arg in args:
-            arg_str = str(arg)
-            parts.append(f"${len(arg_str)}\r\n{arg_str}\r\n")
-        
-        raw_command = "".join(parts)
-        self._buffer.append(raw_command)
+        encode_command_into(self._buffer, command, *args)
+        self._maybe_flush_early()
+
+    def write_bytes(self, frame) -> None:
+        """Buffers a command already encoded as RESP, e.g. the frame sent to replicas."""
+        if not self._running:
+            return
+        self._buffer += frame
+        self._maybe_flush_early()
+
+    def _maybe_flush_early(self):
+        buf = self._buffer
+        # A flush in flight keeps draining the buffer itself (see fsync), so at most one
+        # early flush is pending at a time.
+        if len(buf) >= AOF_FLUSH_BYTES and self._flush_future is None and self._fd is not None \
+                and (self._early_flush is None or self._early_flush.done()):
+            self._early_flush = self._loop.create_task(self.fsync())
 
     async def _periodic_flush(self):
         """Background task to flush buffer to disk."""
@@ -51,44 +104,55 @@ class AofHandler:
 
     async def fsync(self):
         """Flushes the buffer to disk in a separate thread to avoid blocking."""
-        if not self._buffer:
+        if self._flush_future is not None:
             return
 
-        current_batch = list(self._buffer)
-        self._buffer.clear()
-        
-        if not current_batch:
-            return
+        loop = asyncio.get_running_loop()
+        # Writes arriving during a flush go to a fresh buffer; if they fill it past
+        # AOF_FLUSH_BYTES meanwhile, flush again rather than wait for the next interval.
+        while self._buffer and self._fd is not None:
+            current_batch, self._buffer = self._buffer, bytearray()
+            future = self._flush_future = loop.run_in_executor(None, _flush_to_disk, self._fd, current_batch)
+            # Cleared by the future's own callback, which runs before any waiter resumes.
+            future.add_done_callback(self._flush_done)
+            await future
+            if len(self._buffer) < AOF_FLUSH_BYTES:
+                break
 
-        def _flush_to_disk():
-            try:
-                if self._file:
-                    for cmd in current_batch:
-                        self._file.write(cmd)
-                    self._file.flush()
-                    os.fsync(self._file.fileno())
-            except Exception as e:
-                logger.error(f"Error flushing AOF: {e}")
+    def _flush_done(self, future: asyncio.Future):
+        if self._flush_future is future:
+            self._flush_future = None
 
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, _flush_to_disk)
+    async def _wait_for_flush(self):
+        """
+        Waits until no executor flush is using the descriptor. Callers detach the
+        descriptor first, so no further flush can start once this one is done.
+        """
+        future = self._flush_future
+        if future is not None:
+            await asyncio.wait([future])
 
-    def close(self):
+    async def close(self):
         """Closes the AOF file and stops the flusher."""
         self._running = False
-        if self._file:
-            try:
-                if self._buffer:
-                    for cmd in self._buffer:
-                        self._file.write(cmd)
-                    self._file.flush()
-                    os.fsync(self._file.fileno())
-            except Exception as e:
-                logger.error(f"Error executing final AOF flush: {e}")
-
-            self._file.close()
-            self._file = None
-            logger.info("AOF file closed.")
+        # Detached first, so no new flush starts on it.
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+
+        await self._wait_for_flush()
+        if self._flush_task:
+            self._flush_task.cancel()
+        try:
+            if self._buffer:
+                _write_all(fd, self._buffer)
+                self._buffer.clear()
+            _fdatasync(fd)
+        except Exception as e:
+            logger.error(f"Error executing final AOF flush: {e}")
+
+        os.close(fd)
+        logger.info("AOF file closed.")
 
     def load(self) -> List[Tuple[str, List[str]]]:
         """Reads the AOF file and parses commands to be replayed, with progress indicator."""
@@ -183,60 +247,69 @@ class AofHandler:
         """Rewrites the AOF file based on current memory state to reduce file size."""
         temp_path = self._path + ".rewrite"
         try:
-            with open(temp_path, 'w', buffering=1, encoding='utf-8') as f:
-                for key, value in data.items():
-                    if not isinstance(value, tuple) or len(value) != 3:
-                        continue
-                        
-                    data_type, content, expire_at = value
+            # Encoded exactly like live writes, then written out in one go.
+            out = bytearray()
+            for key, value in data.items():
+                if not isinstance(value, tuple) or len(value) != 3:
+                    continue
                     
-                    if expire_at and time.time() > expire_at:
-                        continue
-                        
-                    cmd = None
-                    args = []
+                data_type, content, expire_at = value
+                
+                if expire_at and time.time() > expire_at:
+                    continue
                     
-                    if data_type == 'string':
-                        cmd = "SET"
-                        val_str = content
-                        if isinstance(content, dict):
-                            val_str = json.dumps(content, ensure_ascii=False)
-                        args = [key, val_str]
-
-                    elif data_type == 'list':
-                        cmd = "LPUSH"
-                        args = [key] + list(reversed(content))
+                cmd = None
+                args = []
+                
+                if data_type == 'string':
+                    cmd = "SET"
+                    val_str = content
+                    if isinstance(content, dict):
+                        val_str = json.dumps(content, ensure_ascii=False)
+                    args = [key, val_str]
+
+                elif data_type == 'list':
+                    cmd = "LPUSH"
+                    args = [key, *reversed(content)]
+                
+                elif data_type == 'hash':
+                    for field, val in content.items():
+                        encode_command_into(out, "HSET", key, field, val)
+                    continue
+
+                elif data_type == 'set':
+                    cmd = "SADD"
+                    args = [key, *content]
                     
-                    elif data_type == 'hash':
-                        for field, val in content.items():
-                            self._write_to_file(f, "HSET", key, field, val)
-                        continue
+                if cmd:
+                    encode_command_into(out, cmd, *args)
+                    
+                if expire_at:
+                    ttl = int(expire_at - time.time())
+                    if ttl > 0:
+                        encode_command_into(out, "EXPIRE", key, ttl)
 
-                    elif data_type == 'set':
-                        cmd = "SADD"
-                        args = [key] + list(content)
-                        
-                    if cmd:
-                        self._write_to_file(f, cmd, *args)
-                        
-                    if expire_at:
-                        ttl = int(expire_at - time.time())
-                        if ttl > 0:
-                            self._write_to_file(f, "EXPIRE", key, ttl)
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+            try:
+                _write_all(fd, out)
+                _fdatasync(fd)
+            finally:
+                os.close(fd)
 
-            was_running = self._running
-            self._running = False
-            
-            if self._file:
-                if self._buffer:
-                    for c in self._buffer: self._file.write(c)
-                self._file.close()
-            
-            if os.path.exists(self._path):
-                os.remove(self._path)
-            os.rename(temp_path, self._path)
-            
-            self.open()
+            # Everything buffered so far is already in `data`. Commands written from here on
+            # keep buffering and are flushed to the new file once it is in place. The old
+            # descriptor is detached so no new flush starts on it while it is replaced.
+            buffered, self._buffer = self._buffer, bytearray()
+            old_fd, self._fd = self._fd, None
+            try:
+                await self._wait_for_flush()
+                if old_fd is not None:
+                    _write_all(old_fd, buffered)
+                    os.close(old_fd)
+                os.replace(temp_path, self._path)
+            finally:
+                if old_fd is not None:
+                    self._fd = self._open_fd()
             
             logger.info("AOF Rewrite complete. File compacted.")
             return True
@@ -245,17 +318,8 @@ class AofHandler:
             logger.error(f"AOF Rewrite failed: {e}")
             if os.path.exists(temp_path):
                 os.remove(temp_path)
-            if not self._file and was_running:
-                self.open()
             return False
 
-    def _write_to_file(self, f, command, *args):
-        """Helper to write RESP command to a file object"""
-        parts = [f"*{len(args) + 1}\r\n", f"${len(command)}\r\n{command}\r\n"]
-        for arg in args:
-            arg_str = str(arg)
-            parts.append(f"${len(arg_str)}\r\n{arg_str}\r\n")
-        f.write("".join(parts))
 
 class SnapshotHandler:
     """Manages saving/loading database snapshots."""
@@ -263,13 +327,13 @@ class SnapshotHandler:
     def __init__(self, path: str):
         self._path = path
 
-    def save(self, data: Dict[str, Any]):
-        """Saves data to a JSON snapshot file. Handles bytes via Base64."""
+    def _encode(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Converts data to plain JSON types. Handles bytes via Base64."""
         
         def encode_value(val):
             if isinstance(val, bytes):
                 return {"__type__": "bytes", "data": base64.b64encode(val).decode('ascii')}
-            elif isinstance(val, list):
+            elif isinstance(val, (list, deque)):
                 return [encode_value(v) for v in val]
             elif isinstance(val, set):
                 return [encode_value(v) for v in val]
@@ -279,13 +343,38 @@ class SnapshotHandler:
                 return [encode_value(v) for v in val]
             return val
 
-        json_ready = {}
-        for k, v in data.items():
-            json_ready[k] = encode_value(v)
+        return {k: encode_value(v) for k, v in data.items()}
+
+    def _write(self, json_ready: Dict[str, Any]):
+        """Serializes the encoded data and atomically replaces the snapshot file."""
+        payload = orjson.dumps(json_ready) if orjson else json.dumps(json_ready).encode('utf-8')
+        # Write next to the target and rename over it, so a crash never leaves a truncated file.
+        tmp_path = self._path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            _write_all(fd, payload)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, self._path)
+
+    def save(self, data: Dict[str, Any]):
+        """Saves data to a JSON snapshot file."""
+        try:
+            self._write(self._encode(data))
+            logger.info(f"Database snapshot saved to '{self._path}'.")
+        except Exception as e:
+            logger.error(f"Error saving snapshot: {e}")
 
+    async def save_async(self, data: Dict[str, Any]):
+        """
+        Saves data like save(), but serializes and writes from a worker thread.
+        The encoding pass runs first on the event loop: it copies every list, set and
+        hash, so the thread never sees values that commands are still mutating.
+        """
         try:
-            with open(self._path, 'w', encoding='utf-8') as f:
-                json.dump(json_ready, f)
+            json_ready = self._encode(data)
+            await asyncio.get_running_loop().run_in_executor(None, self._write, json_ready)
             logger.info(f"Database snapshot saved to '{self._path}'.")
         except Exception as e:
             logger.error(f"Error saving snapshot: {e}")
@@ -323,9 +412,9 @@ class SnapshotHandler:
             logger.error(f"Error loading snapshot: {e}")
             return {}
 
-async def periodic_snapshot(storage, interval: int):
+async def periodic_snapshot(storage, snapshot_handler: SnapshotHandler, interval: int):
     """Background task to periodically save a snapshot."""
     while True:
         await asyncio.sleep(interval)
         logger.info("Starting periodic snapshot...")
-        await storage.save_snapshot()
+        await snapshot_handler.save_async(storage.get_all_data())
@@ -5,6 +5,43 @@ from .exceptions import CommandError, WrongTypeError
 
 logger = logging.getLogger(__name__)
 
+# Pre-encoded RESP replies, shared instead of being rebuilt for every response.
+RESP_OK = b"+OK\r\n"
+RESP_QUEUED = b"+QUEUED\r\n"
+RESP_NIL = b"_(nil)\r\n"
+
+# Pre-encoded bulk string headers ("$<len>\r\n") for payloads of up to BULK_HEADER_MAX
+# bytes. Same name and bound as in the standalone ignisdb_server.py, which keeps its own
+# copy because it is a single-file server.
+BULK_HEADER_MAX = 4096
+RESP_BULK_HEADERS = tuple(b"$%d\r\n" % n for n in range(BULK_HEADER_MAX + 1))
+
+def bulk_header(n: int) -> bytes:
+    """Returns the RESP bulk string header for a payload of n bytes."""
+    return RESP_BULK_HEADERS[n] if n <= BULK_HEADER_MAX else b"$%d\r\n" % n
+
+def encode_command_into(out: bytearray, command: str, *args: Any):
+    """
+    Appends a command encoded as a RESP array to the caller's buffer.
+    Arguments are UTF-8 encoded (bytes pass through), so bulk lengths count bytes.
+    """
+    encoded = command.encode('utf-8')
+    out += b"*%d\r\n" % (len(args) + 1)
+    out += bulk_header(len(encoded))
+    out += encoded
+    out += b"\r\n"
+    for arg in args:
+        encoded = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        out += bulk_header(len(encoded))
+        out += encoded
+        out += b"\r\n"
+
+def _decode_arg(arg: bytes) -> str:
+    try:
+        return arg.decode('utf-8')
+    except UnicodeDecodeError:
+        return arg.decode('latin-1')
+
 class ProtocolHandler:
     """Parses raw client data into commands and formats responses into RESP."""
     
@@ -83,9 +120,10 @@ class ProtocolHandler:
                     idx += arg_len + 2  # Skip data + \r\n
                     
                 if parts:
-                    # Decode all args to string using latin-1 (lossless for 0-255 byte values)
+                    # Args are UTF-8 like inline ones and like replies; bytes that are not
+                    # valid UTF-8 fall back to latin-1, which maps every byte value.
                     cmd = parts[0].decode('utf-8')
-                    args = [p.decode('latin-1') for p in parts[1:]]
+                    args = [_decode_arg(p) for p in parts[1:]]
                     return cmd, args
                     
             except Exception:
@@ -98,31 +136,46 @@ class ProtocolHandler:
         
         return parts[0].decode('utf-8'), [p.decode('utf-8') for p in parts[1:]]
 
-    def format_response(self, result: Any) -> str:
-        """Formats a Python object into a RESP string for the client."""
+    def format_response(self, result: Any, out: bytearray):
+        """
+        Appends the RESP encoding of a Python object to the caller's output buffer.
+        Bulk string lengths are byte lengths of the UTF-8 encoding.
+        """
         if result is None:
-            return "_(nil)\r\n"
+            out += RESP_NIL
         elif isinstance(result, str):
-            if result == "OK" or result == "QUEUED":
-                return f"+{result}\r\n"
-            return f"${len(result)}\r\n{result}\r\n"
+            if result == "OK":
+                out += RESP_OK
+            elif result == "QUEUED":
+                out += RESP_QUEUED
+            else:
+                encoded = result.encode('utf-8')
+                out += bulk_header(len(encoded))
+                out += encoded
+                out += b"\r\n"
+        elif isinstance(result, bytes):
+            out += bulk_header(len(result))
+            out += result
+            out += b"\r\n"
         elif isinstance(result, int):
-            return f":{result}\r\n"
+            out += b":%d\r\n" % result
         elif isinstance(result, list):
-            response_parts = [f"*{len(result)}\r\n"]
+            # Items are appended in place; no intermediate strings are joined.
+            out += b"*%d\r\n" % len(result)
             for item in result:
-                response_parts.append(self.format_response(item))
-            return "".join(response_parts)
+                self.format_response(item, out)
         elif isinstance(result, dict):
             # Serialize dictionary as JSON string
-            json_str = json.dumps(result, ensure_ascii=False)
-            return f"${len(json_str)}\r\n{json_str}\r\n"
+            encoded = json.dumps(result, ensure_ascii=False).encode('utf-8')
+            out += bulk_header(len(encoded))
+            out += encoded
+            out += b"\r\n"
         elif isinstance(result, Exception):
             err_type = "WRONGTYPE" if isinstance(result, WrongTypeError) else "ERR"
-            return f"-{err_type} {str(result)}\r\n"
+            out += f"-{err_type} {str(result)}\r\n".encode('utf-8')
         else:
             logger.error(f"Cannot format unknown response type: {type(result)}")
-            return f"-ERR Server error: cannot format response\r\n"
+            out += b"-ERR Server error: cannot format response\r\n"
 
     def format_command_as_bytes(self, command: str, *args: Any) -> bytes:
         """Formats a command and arguments into a RESP byte string (for replication)."""
@@ -15,7 +15,7 @@ class PubSubManager:
         if channel not in self.channels:
             self.channels[channel] = set()
         self.channels[channel].add(writer)
-        logger.debug(f"Client subscribed to {channel}")
+        logger.debug("Client subscribed to %s", channel)
 
     def unsubscribe(self, channel: str, writer: Any):
         """Unsubscribes a client from a channel."""
@@ -23,7 +23,7 @@ class PubSubManager:
             self.channels[channel].discard(writer)
             if not self.channels[channel]:
                 del self.channels[channel]
-            logger.debug(f"Client unsubscribed from {channel}")
+            logger.debug("Client unsubscribed from %s", channel)
 
     async def publish(self, channel: str, message: str) -> int:
         """Publishes a message to a channel. Returns number of clients receiving it."""
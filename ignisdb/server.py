@@ -3,7 +3,7 @@ import logging
 import argparse
 from typing import Optional
 from .storage import StorageEngine
-from .protocol import ProtocolHandler
+from .protocol import ProtocolHandler, encode_command_into
 from .mysql_protocol import MySQLProtocolHandler
 from .persistence import AofHandler, SnapshotHandler, periodic_snapshot
 from .commands import CommandRegistry
@@ -14,6 +14,15 @@ from .security import SecurityManager
 
 logger = logging.getLogger(__name__)
 
+# Replies are flushed mid-batch once this many bytes are pending, so a pipeline of large
+# replies is streamed out with backpressure instead of being collected in memory first.
+MAX_PIPELINE_BYTES = 65536
+
+# Commands that are persisted to the AOF and propagated to replicas.
+WRITE_COMMANDS = frozenset({'SET', 'DELETE', 'EXPIRE', 'LPUSH', 'HSET', 'SADD', 'SREM'})
+# Commands whose real work happens in handle_client after their handler has run.
+ADMIN_COMMANDS = frozenset({'SYNC', 'REPLICAOF', 'EXPORT', 'IMPORT', 'BGREWRITEAOF'})
+
 class IgnisServer:
     def __init__(self, host: str, port: int, persistence_mode: str, 
                  snapshot_path: str, aof_path: str, snapshot_interval: int, 
@@ -37,19 +46,25 @@ class IgnisServer:
 
         # Pre-instantiate commands for performance (Singleton-like usage)
         self.command_handlers = {}
-        for cmd_name in CommandRegistry._commands:
-            self.command_handlers[cmd_name] = CommandRegistry.get_command(cmd_name)()
+        # Maps both usual spellings of each command to its canonical uppercase name, so the
+        # common case is a single dict hit with no per-request str.upper().
+        self.command_names = {}
+        for cmd_name, command_cls in CommandRegistry._commands.items():
+            self.command_handlers[cmd_name] = command_cls()
+            self.command_names[cmd_name] = self.command_names[cmd_name.lower()] = cmd_name
 
     async def initialize(self):
         """Initializes persistence and loads data."""
         if self.aof_handler:
             self.aof_handler.open()
+
+        asyncio.create_task(self.storage.active_expire())
             
         if self.persistence_mode == 'snapshot':
             data = self.snapshot_handler.load()
-            await self.storage.load_data(data)
+            self.storage.load_data(data)
             if self.snapshot_interval > 0:
-                asyncio.create_task(periodic_snapshot(self.storage, self.snapshot_interval))
+                asyncio.create_task(periodic_snapshot(self.storage, self.snapshot_handler, self.snapshot_interval))
         elif self.persistence_mode == 'aof':
             logging.info("Replaying AOF...")
             commands = self.aof_handler.load()
@@ -57,6 +72,7 @@ class IgnisServer:
             
             # Context for replay (no network writer)
             replay_context = ServerContext(storage=self.storage, pubsub=self.pubsub, server=self)
+            self.storage.refresh_clock()
             
             for i, (cmd_name, args) in enumerate(commands):
                 # FIX: Force uppercase lookup because keys in command_handlers are UPPERCASE
@@ -72,7 +88,7 @@ class IgnisServer:
 
     async def handle_client(self, reader, writer):
         addr = writer.get_extra_info('peername')
-        logger.info(f"New connection from {addr}")
+        logger.info("New connection from %s", addr)
         
         # Connection State
         authenticated = False if self.password else True
@@ -81,9 +97,9 @@ class IgnisServer:
         parse_command = self.protocol.parse_command
         format_response = self.protocol.format_response
         command_handlers = self.command_handlers
+        command_names = self.command_names
         storage = self.storage
         aof = self.aof_handler
-        write_cmds = {'SET', 'DELETE', 'EXPIRE', 'LPUSH', 'HSET', 'SADD', 'SREM'}
         
         # Create Context for this connection
         conn_context = ServerContext(
@@ -95,6 +111,10 @@ class IgnisServer:
             security=self.security
         )
         
+        # Replies for a whole read batch are collected here and written out at once;
+        # the buffer is cleared and reused rather than reallocated per batch.
+        out = bytearray()
+
         try:
             buffer = b""
             while True:
@@ -102,17 +122,20 @@ class IgnisServer:
                 if not data: break
                 
                 buffer += data
+                # Every command in this batch sees the same clock reading.
+                storage.refresh_clock()
                 
                 while True:
                     frame, buffer = self.protocol.extract_frame(buffer)
                     if frame is None: break
                     
                     try:
-                        cmd_name, args = parse_command(frame)
+                        raw_name, args = parse_command(frame)
+                        cmd_name = command_names.get(raw_name) or raw_name.upper()
                         
                         # Authentication Check
                         if self.password and not authenticated:
-                            if cmd_name.upper() == 'AUTH':
+                            if cmd_name == 'AUTH':
                                 if len(args) == 1 and args[0] == self.password:
                                     authenticated = True
                                     result = "OK"
@@ -126,128 +149,124 @@ class IgnisServer:
                             handler = command_handlers.get(cmd_name)
                             
                             if not handler:
-                                raise CommandError(f"Unknown command '{cmd_name}'")
+                                raise CommandError(f"Unknown command '{raw_name}'")
                             
                             result = await handler.execute(conn_context, *args)
                             
-                            # Persist write commands
-                            if cmd_name in write_cmds:
+                            # Persist write commands. The command is encoded once, and the
+                            # same RESP frame goes to the AOF and to every replica.
+                            if cmd_name in WRITE_COMMANDS and (aof or self.replicas):
+                                frame = bytearray()
+                                encode_command_into(frame, cmd_name, *args)
                                 if aof:
-                                    aof.write(cmd_name, *args)
-                                
-                                # Replication Propagate
-                                if self.replicas:
+                                    aof.write_bytes(frame)
+                                for replica in list(self.replicas):
                                     try:
-                                        # Use Inline format because ProtocolHandler only supports Inline parsing currently.
-                                        # format: CMD arg1 arg2\r\n
-                                        # Note: This is not binary safe for args with spaces, but consistent with current parser.
-                                        
-                                        # Convert args to string
-                                        str_args = [str(arg) for arg in args]
-                                        inline_cmd = f"{cmd_name} {' '.join(str_args)}\\r\\n".encode('utf-8')
-                                        
-                                        for replica in list(self.replicas):
-                                            try:
-                                                replica.write(inline_cmd)
-                                            except Exception as e:
-                                                logger.error(f"Error persisting to replica: {e}")
-                                                self.replicas.discard(replica)
+                                        replica.write(frame)
                                     except Exception as e:
-                                        logger.error(f"Error constructing replication payload: {e}")
-                            
-                            # Special Admin Commands
-                            if cmd_name.upper() == 'SYNC':
-                                # Client wants to be a replica
-                                self.replicas.add(writer)
-                                logger.info(f"Client {addr} registered as REPLICA")
-                                # Ideally we send a snapshot here.
-                                # For MVP, we just start forwarding new writes.
-                                # But we should send standard "OK" or "+FULLRESYNC"
-                                # Redis sends RDB. We'll send OK to keep connection alive.
-                                # IMPORTANT: Replica usually does NOT expect standard response to SYNC, 
-                                # it expects RDB stream.
-                                # Let's send a simple OK so replica knows we accepted.
-                                pass # We don't return 'result' here if we want to stream?
-                                # Actually, let's just return OK and let logic flow.
-                                result = "OK"
+                                        logger.error(f"Error persisting to replica: {e}")
+                                        self.replicas.discard(replica)
 
-                            elif cmd_name.upper() == 'REPLICAOF':
-                                if len(args) != 2:
-                                     raise CommandError("ERR wrong number of arguments for 'replicaof'")
-                                host, port = args[0], args[1]
-                                if host.upper() == "NO" and port.upper() == "ONE":
-                                    # Turn off replication
-                                    # TODO: implement stop replication
-                                    result = "OK"
-                                else:
-                                    # Start replication task
-                                    # connecting to master
-                                    asyncio.create_task(self.connect_to_master(host, int(port)))
+                            # Special Admin Commands
+                            if cmd_name in ADMIN_COMMANDS:
+                                if cmd_name == 'SYNC':
+                                    # Client wants to be a replica
+                                    self.replicas.add(writer)
+                                    logger.info(f"Client {addr} registered as REPLICA")
+                                    # Ideally we send a snapshot here.
+                                    # For MVP, we just start forwarding new writes.
+                                    # But we should send standard "OK" or "+FULLRESYNC"
+                                    # Redis sends RDB. We'll send OK to keep connection alive.
+                                    # IMPORTANT: Replica usually does NOT expect standard response to SYNC, 
+                                    # it expects RDB stream.
+                                    # Let's send a simple OK so replica knows we accepted.
+                                    pass # We don't return 'result' here if we want to stream?
+                                    # Actually, let's just return OK and let logic flow.
                                     result = "OK"
 
-                            elif cmd_name.upper() == 'EXPORT':
-                                # Export data to .ignis file
-                                filename = "dump.ignis"
-                                if len(args) > 0:
-                                    filename = args[0]
-                                    if not filename.endswith('.ignis'):
-                                        filename += ".ignis"
+                                elif cmd_name == 'REPLICAOF':
+                                    if len(args) != 2:
+                                         raise CommandError("ERR wrong number of arguments for 'replicaof'")
+                                    host, port = args[0], args[1]
+                                    if host.upper() == "NO" and port.upper() == "ONE":
+                                        # Turn off replication
+                                        # TODO: implement stop replication
+                                        result = "OK"
+                                    else:
+                                        # Start replication task
+                                        # connecting to master
+                                        asyncio.create_task(self.connect_to_master(host, int(port)))
+                                        result = "OK"
+
+                                elif cmd_name == 'EXPORT':
+                                    # Export data to .ignis file
+                                    filename = "dump.ignis"
+                                    if len(args) > 0:
+                                        filename = args[0]
+                                        if not filename.endswith('.ignis'):
+                                            filename += ".ignis"
                                 
-                                logger.info(f"Exporting data to {filename}...")
-                                data_snapshot = await storage.get_all_data()
-                                # Reuse SnapshotHandler logic for JSON dumping
-                                exporter = SnapshotHandler(filename)
-                                exporter.save(data_snapshot)
-                                result = f"Data exported to {filename}"
+                                    logger.info(f"Exporting data to {filename}...")
+                                    data_snapshot = storage.get_all_data()
+                                    # Reuse SnapshotHandler logic for JSON dumping
+                                    exporter = SnapshotHandler(filename)
+                                    exporter.save(data_snapshot)
+                                    result = f"Data exported to {filename}"
 
-                            elif cmd_name.upper() == 'IMPORT':
-                                # Import data from .ignis file
-                                filename = "dump.ignis"
-                                if len(args) > 0:
-                                    filename = args[0]
-                                    if not filename.endswith('.ignis'):
-                                        filename += ".ignis"
+                                elif cmd_name == 'IMPORT':
+                                    # Import data from .ignis file
+                                    filename = "dump.ignis"
+                                    if len(args) > 0:
+                                        filename = args[0]
+                                        if not filename.endswith('.ignis'):
+                                            filename += ".ignis"
                                 
-                                import os
-                                if not os.path.exists(filename):
-                                    raise CommandError(f"ERR Import file '{filename}' not found")
+                                    import os
+                                    if not os.path.exists(filename):
+                                        raise CommandError(f"ERR Import file '{filename}' not found")
                                 
-                                logger.info(f"Importing data from {filename}...")
-                                importer = SnapshotHandler(filename)
-                                loaded_data = importer.load()
+                                    logger.info(f"Importing data from {filename}...")
+                                    importer = SnapshotHandler(filename)
+                                    loaded_data = importer.load()
                                 
-                                count = await storage.restore_data(loaded_data)
+                                    count = storage.restore_data(loaded_data)
                                 
-                                # AOF Persistence for Imported Data
-                                if aof:
-                                    # Optimized: Instead of appending millions of commands to the AOF buffer (RAM spike),
-                                    # we trigger a background rewrite which streams current DB state to disk efficiently.
-                                    logger.info("Triggering background AOF rewrite to persist imported data...")
-                                    asyncio.create_task(aof.rewrite(await storage.get_all_data()))
+                                    # AOF Persistence for Imported Data
+                                    if aof:
+                                        # Optimized: Instead of appending millions of commands to the AOF buffer (RAM spike),
+                                        # we trigger a background rewrite which streams current DB state to disk efficiently.
+                                        logger.info("Triggering background AOF rewrite to persist imported data...")
+                                        asyncio.create_task(aof.rewrite(storage.get_all_data()))
                                 
-                                result = f"Imported {count} keys from {filename}"
+                                    result = f"Imported {count} keys from {filename}"
 
-                            elif cmd_name.upper() == 'BGREWRITEAOF':
-                                if aof:
-                                    data_snapshot = await storage.get_all_data()
-                                    logger.info("Starting AOF rewrite...")
-                                    await aof.rewrite(data_snapshot)
-                                    result = "Background append only file rewriting started" 
-                                else:
-                                    raise CommandError("AOF persistence is not enabled")
+                                elif cmd_name == 'BGREWRITEAOF':
+                                    if aof:
+                                        data_snapshot = storage.get_all_data()
+                                        logger.info("Starting AOF rewrite...")
+                                        await aof.rewrite(data_snapshot)
+                                        result = "Background append only file rewriting started" 
+                                    else:
+                                        raise CommandError("AOF persistence is not enabled")
 
                             
-                        response = format_response(result)
+                        format_response(result, out)
                         
                     except (CommandError, WrongTypeError, ValueError) as e:
-                        response = format_response(e)
+                        format_response(e, out)
                     except Exception as e:
                         logger.error(f"Unexpected error: {e}")
-                        response = format_response(CommandError("Server error"))
-                    
-                    writer.write(response.encode('utf-8'))
+                        format_response(CommandError("Server error"), out)
+
+                    if len(out) >= MAX_PIPELINE_BYTES:
+                        writer.write(bytes(out))
+                        out.clear()
+                        await writer.drain()
                 
-                await writer.drain()
+                if out:
+                    writer.write(bytes(out))
+                    out.clear()
+                    await writer.drain()
                 
         except ConnectionResetError:
             logger.warning(f"Connection reset by {addr}")
@@ -255,7 +274,7 @@ class IgnisServer:
             self.pubsub.remove_client(writer)
             writer.close()
             await writer.wait_closed()
-            logger.info(f"Connection closed for {addr}")
+            logger.info("Connection closed for %s", addr)
 
     async def connect_to_master(self, host: str, port: int):
         """Connects to a master instance and initiates replication."""
@@ -266,53 +285,34 @@ class IgnisServer:
             # 1. PING (optional, but good)
             # 2. AUTH (if needed)
             # 3. SYNC
-            writer.write(b"SYNC\\r\\n")
+            writer.write(b"SYNC\r\n")
             await writer.drain()
             
             logger.info("Sent SYNC to master. Waiting for stream...")
             
-            # Loop to read commands from Master and execute them locally
+            # Loop to read commands from Master and execute them locally. The master sends
+            # RESP arrays, which may arrive split across reads.
+            # Master doesn't expect responses to propagated commands, so none are sent.
+            ctx = ServerContext(storage=self.storage, pubsub=self.pubsub, server=self, aof=self.aof_handler)
+            buffer = b""
             while True:
                 data = await reader.read(65536)
                 if not data: break
-                
-                # We need to process these commands as if they were local writes
-                # But without writing to AOF? Or YES writing to AOF?
-                # Usually Replicas DO write to their own AOF.
-                # We can reuse handle_client logic but we don't have a 'writer' for response?
-                # Master doesn't expect responses to propagated commands.
-                # So we need a special 'execute_command' function that doesn't reply.
-                
-                # Quick hack: Parse and execute directly
-                buffer = data
-                while b'\\n' in buffer:
-                    line, buffer = buffer.split(b'\\n', 1)
-                    line = line.strip()
-                    if not line: continue
-                     
-                    # If line starts with *, it's RESP array.
-                    # Our current parser might be simple.
-                    # As defined in replica propagation above, we send RESP.
-                    # If our ProtocolHandler parses RESP, use it.
-                    # For now, let's assume we can parse it.
-                    # NOTE: This simple parser in handle_client splits by \\n.
-                    # RESP arrays have newlines.
-                    # This indicates we need a proper RESP parser for replication to work 100%.
-                    # But for now, let's try to reuse what we have.
-                    
+                buffer += data
+                self.storage.refresh_clock()
+
+                while True:
+                    frame, buffer = self.protocol.extract_frame(buffer)
+                    if frame is None: break
                     try:
-                        cmd_name, args = self.protocol.parse_command(line)
-                        if cmd_name:
-                             handler = self.command_handlers.get(cmd_name)
-                             if handler:
-                                 # Create a dummy context
-                                 # We pass 'writer=None' so commands don't fail if they don't need it.
-                                 # PubSub commands need it, but we unlikely replicate subscribe.
-                                 ctx = ServerContext(storage=self.storage, pubsub=self.pubsub, server=self, aof=self.aof_handler)
-                                 await handler.execute(ctx, *args)
-                                 # We also write to our AOF if enabled
-                                 if self.aof_handler and cmd_name in {'SET', 'DELETE', 'SADD', 'SREM'}:
-                                     self.aof_handler.write(cmd_name, *args)
+                        cmd_name, args = self.protocol.parse_command(frame)
+                        # The master's reply to SYNC (+OK) is not a command and is skipped.
+                        handler = self.command_handlers.get(cmd_name)
+                        if handler:
+                            await handler.execute(ctx, *args)
+                            # Replicas write propagated commands to their own AOF as well.
+                            if self.aof_handler and cmd_name in WRITE_COMMANDS:
+                                self.aof_handler.write_bytes(frame)
                     except Exception as e:
                         logger.error(f"Replica execution error: {e}")
 
@@ -321,7 +321,7 @@ class IgnisServer:
 
     async def handle_mysql_client(self, reader, writer):
         addr = writer.get_extra_info('peername')
-        logger.info(f"New MySQL connection from {addr}")
+        logger.info("New MySQL connection from %s", addr)
         handler = MySQLProtocolHandler(reader, writer, self.storage)
         await handler.handle_connection()
 
@@ -344,6 +344,6 @@ class IgnisServer:
         async with server:
             await server.serve_forever()
 
-    def shutdown(self):
+    async def shutdown(self):
         if self.aof_handler:
-            self.aof_handler.close()
+            await self.aof_handler.close()
@@ -1,116 +1,208 @@
 import time
+import heapq
+import asyncio
 import logging
-from typing import Dict, Tuple, Any, Optional
+from collections import deque
+from itertools import islice
+from typing import Dict, List, Tuple, Any, Optional
 from .exceptions import WrongTypeError
 
 logger = logging.getLogger(__name__)
 
+# How often the active expiration task wakes up, and how many keys it may delete per pass.
+ACTIVE_EXPIRE_INTERVAL = 0.1
+ACTIVE_EXPIRE_BATCH = 1000
+
+# Value types are stored as small ints; persistence still sees the names.
+TYPE_STRING, TYPE_LIST, TYPE_HASH, TYPE_SET = range(4)
+TYPE_NAMES = ('string', 'list', 'hash', 'set')
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+
 class StorageEngine:
     """
     Manages in-memory data storage and expiration.
     OPTIMIZED: Removed asyncio.Lock since we run in a single-threaded event loop
-    and operations are atomic/non-blocking.
+    and operations are atomic/non-blocking. For the same reason the operations are
+    plain methods: none of them awaits, so they are called without a coroutine.
     """
     def __init__(self):
-        # Data format: { key: (type, value, expiration_timestamp) }
-        self._data: Dict[str, Tuple[str, Any, Optional[float]]] = {}
+        # Keys live in three parallel dicts instead of one dict of (type, value, expiration)
+        # tuples: writes allocate no tuple, and expiry checks only touch the small _expiry dict.
+        # List values are deques so LPUSH is O(1) per element.
+        self._types: Dict[str, int] = {}
+        self._values: Dict[str, Any] = {}
+        # Only keys with a TTL have an entry here.
+        self._expiry: Dict[str, float] = {}
+        # Min-heap of (expiration_timestamp, key) feeding active_expire().
+        # Entries are not removed when a key is overwritten; stale ones are skipped on pop.
+        self._expire_heap: List[Tuple[float, str]] = []
+        # Cached wall clock used by commands (TTLs are persisted as wall-clock timestamps).
+        # Callers refresh it once per batch of commands (see refresh_clock), so a pipeline
+        # reads the clock once rather than once per command.
+        self.now = time.time()
+
+    def refresh_clock(self):
+        """Updates the cached clock. Called before each batch of commands is executed."""
+        self.now = time.time()
 
     def _check_and_delete_expired(self, key: str) -> bool:
         """Helper to check expiration."""
-        item = self._data.get(key)
-        if item:
-            _, _, expiration_time = item
-            if expiration_time is not None and time.time() > expiration_time:
-                del self._data[key]
-                return True
+        expiration_time = self._expiry.get(key)
+        if expiration_time is not None and self.now > expiration_time:
+            self._delete(key)
+            return True
         return False
 
-    async def get(self, key: str):
+    def _delete(self, key: str) -> bool:
+        """Removes a key from all three dicts. Returns whether it existed."""
+        self._expiry.pop(key, None)
+        self._values.pop(key, None)
+        return self._types.pop(key, None) is not None
+
+    def _store_item(self, key: str, item) -> bool:
+        """Stores a persisted (type, value, expire_at) item. Returns False for unknown types."""
+        type_name, value, expire_at = item
+        code = TYPE_CODES.get(type_name)
+        if code is None:
+            return False
+        # Snapshots and imports carry lists and sets as plain JSON lists.
+        if code == TYPE_LIST and not isinstance(value, deque):
+            value = deque(value)
+        elif code == TYPE_SET and not isinstance(value, set):
+            value = set(value)
+        self._types[key] = code
+        self._values[key] = value
+        if expire_at is not None:
+            self._expiry[key] = expire_at
+        else:
+            self._expiry.pop(key, None)
+        return True
+
+    def _rebuild_expire_heap(self):
+        """Recreates the expiration heap from the TTLs currently in _expiry."""
+        self._expire_heap = [(expire_at, key) for key, expire_at in self._expiry.items()]
+        heapq.heapify(self._expire_heap)
+
+    async def active_expire(self):
+        """
+        Background task that periodically deletes keys whose TTL has passed, so keys that
+        are never read again do not stay in memory until the next snapshot sweep.
+        """
+        while True:
+            await asyncio.sleep(ACTIVE_EXPIRE_INTERVAL)
+            self.refresh_clock()
+            heap = self._expire_heap
+            expiry = self._expiry
+            now = self.now
+            deleted = 0
+            while heap and heap[0][0] <= now and deleted < ACTIVE_EXPIRE_BATCH:
+                expiration_time, key = heapq.heappop(heap)
+                # Only delete if the key still carries this TTL (not overwritten or re-expired).
+                if expiry.get(key) == expiration_time:
+                    self._delete(key)
+                    deleted += 1
+
+    def get(self, key: str):
         if self._check_and_delete_expired(key): return None
-        item = self._data.get(key)
-        if item is None: return None
-        type, value, _ = item
-        if type != 'string': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        return value
-
-    async def set(self, key: str, value: Any, expire_seconds: Optional[int] = None):
-        expiration_time = None
+        type = self._types.get(key)
+        if type is None: return None
+        if type != TYPE_STRING: raise WrongTypeError("Operation against a key holding the wrong kind of value")
+        return self._values[key]
+
+    def set(self, key: str, value: Any, expire_seconds: Optional[int] = None):
+        self._types[key] = TYPE_STRING
+        self._values[key] = value
         if expire_seconds is not None:
-            expiration_time = time.time() + expire_seconds
-        self._data[key] = ('string', value, expiration_time)
+            expiration_time = self.now + expire_seconds
+            self._expiry[key] = expiration_time
+            heapq.heappush(self._expire_heap, (expiration_time, key))
+        else:
+            self._expiry.pop(key, None)
         return "OK"
 
-    async def delete(self, key: str) -> int:
+    def delete(self, key: str) -> int:
         if self._check_and_delete_expired(key): return 1
-        if key in self._data:
-            del self._data[key]
-            return 1
-        return 0
+        return 1 if self._delete(key) else 0
 
-    async def expire(self, key: str, seconds: int) -> int:
-        if self._check_and_delete_expired(key) or key not in self._data: return 0
-        type, value, _ = self._data[key]
-        self._data[key] = (type, value, time.time() + seconds)
+    def expire(self, key: str, seconds: int) -> int:
+        if self._check_and_delete_expired(key) or key not in self._types: return 0
+        # Only the TTL changes; the type and value stay where they are.
+        expiration_time = self.now + seconds
+        self._expiry[key] = expiration_time
+        heapq.heappush(self._expire_heap, (expiration_time, key))
         return 1
-    
-    async def lpush(self, key: str, values: list) -> int:
+
+    def lpush(self, key: str, values: list) -> int:
         self._check_and_delete_expired(key)
-        item = self._data.get(key)
-        if item is None:
-            new_list = list(reversed(values))
-            self._data[key] = ('list', new_list, None)
+        type = self._types.get(key)
+        if type is None:
+            new_list = deque()
+            new_list.extendleft(values)
+            self._types[key] = TYPE_LIST
+            self._values[key] = new_list
             return len(new_list)
-        
-        type, current_list, _ = item
-        if type != 'list': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        current_list[:0] = reversed(values)
+
+        if type != TYPE_LIST: raise WrongTypeError("Operation against a key holding the wrong kind of value")
+        current_list = self._values[key]
+        current_list.extendleft(values)
         return len(current_list)
 
-    async def lrange(self, key: str, start: int, stop: int) -> list:
+    def lrange(self, key: str, start: int, stop: int) -> list:
         if self._check_and_delete_expired(key): return []
-        item = self._data.get(key)
-        if item is None: return []
-        
-        type, current_list, _ = item
-        if type != 'list': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        
-        if stop == -1: return current_list[start:]
-        return current_list[start : stop + 1]
-
-    async def hset(self, key: str, field: str, value: str) -> int:
+        type = self._types.get(key)
+        if type is None: return []
+        if type != TYPE_LIST: raise WrongTypeError("Operation against a key holding the wrong kind of value")
+        current_list = self._values[key]
+
+        # Deques have no slicing; resolve negative indexes and walk with islice.
+        length = len(current_list)
+        if start < 0: start = max(length + start, 0)
+        if stop < 0: stop = length + stop
+        if stop < start: return []
+        return list(islice(current_list, start, stop + 1))
+
+    def hset(self, key: str, field: str, value: str) -> int:
         self._check_and_delete_expired(key)
-        item = self._data.get(key)
-        if item is None:
-            self._data[key] = ('hash', {field: value}, None)
+        type = self._types.get(key)
+        if type is None:
+            self._types[key] = TYPE_HASH
+            self._values[key] = {field: value}
             return 1
-        
-        type, current_hash, _ = item
-        if type != 'hash': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        
+
+        if type != TYPE_HASH: raise WrongTypeError("Operation against a key holding the wrong kind of value")
+        current_hash = self._values[key]
+
         is_new = 1 if field not in current_hash else 0
         current_hash[field] = value
         return is_new
 
-    async def hget(self, key: str, field: str):
+    def hget(self, key: str, field: str):
         if self._check_and_delete_expired(key): return None
-        item = self._data.get(key)
-        if item is None: return None
-        
-        type, current_hash, _ = item
-        if type != 'hash': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        
-        return current_hash.get(field)
-    
-    async def sadd(self, key: str, members: list) -> int:
+        type = self._types.get(key)
+        if type is None: return None
+        if type != TYPE_HASH: raise WrongTypeError("Operation against a key holding the wrong kind of value")
+
+        return self._values[key].get(field)
+
+    def hmget(self, key: str, fields: list) -> list:
+        if self._check_and_delete_expired(key): return [None] * len(fields)
+        type = self._types.get(key)
+        if type is None: return [None] * len(fields)
+        if type != TYPE_HASH: raise WrongTypeError("Operation against a key holding the wrong kind of value")
+
+        current_hash = self._values[key]
+        return [current_hash.get(field) for field in fields]
+
+    def sadd(self, key: str, members: list) -> int:
         self._check_and_delete_expired(key)
-        item = self._data.get(key)
-        if item is None:
-            self._data[key] = ('set', set(), None)
-            item = self._data[key]
-        
-        type, current_set, _ = item
-        if type != 'set': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        
+        type = self._types.get(key)
+        if type is None:
+            self._types[key] = TYPE_SET
+            self._values[key] = set()
+        elif type != TYPE_SET:
+            raise WrongTypeError("Operation against a key holding the wrong kind of value")
+        current_set = self._values[key]
+
         count = 0
         for member in members:
             if member not in current_set:
@@ -118,14 +210,13 @@ class StorageEngine:
                 count += 1
         return count
 
-    async def srem(self, key: str, members: list) -> int:
+    def srem(self, key: str, members: list) -> int:
         if self._check_and_delete_expired(key): return 0
-        item = self._data.get(key)
-        if item is None: return 0
-        
-        type, current_set, _ = item
-        if type != 'set': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        
+        type = self._types.get(key)
+        if type is None: return 0
+        if type != TYPE_SET: raise WrongTypeError("Operation against a key holding the wrong kind of value")
+        current_set = self._values[key]
+
         count = 0
         for member in members:
             if member in current_set:
@@ -133,36 +224,42 @@ class StorageEngine:
                 count += 1
         return count
 
-    async def smembers(self, key: str) -> list:
+    def smembers(self, key: str) -> list:
         if self._check_and_delete_expired(key): return []
-        item = self._data.get(key)
-        if item is None: return []
-        
-        type, current_set, _ = item
-        if type != 'set': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        
-        return list(current_set)
-    
+        type = self._types.get(key)
+        if type is None: return []
+        if type != TYPE_SET: raise WrongTypeError("Operation against a key holding the wrong kind of value")
+
+        return list(self._values[key])
+
     # --- For Persistence ---
-    async def get_all_data(self):
-        """Returns a copy of internal data for snapshotting."""
-        # Prune expired keys first - creating list to avoid runtime error during iteration
-        keys = list(self._data.keys())
-        for key in keys:
-            self._check_and_delete_expired(key)
-        return self._data.copy()
-
-    async def load_data(self, data):
+    def get_all_data(self):
+        """Returns a copy of internal data for snapshotting, as { key: (type, value, expiration_timestamp) }."""
+        # Prune expired keys first: only keys with a TTL can expire, found with one clock read.
+        self.refresh_clock()
+        now = self.now
+        expired = [key for key, expire_at in self._expiry.items() if expire_at < now]
+        for key in expired:
+            self._delete(key)
+        values = self._values
+        expiry = self._expiry
+        return {key: (TYPE_NAMES[type], values[key], expiry.get(key)) for key, type in self._types.items()}
+
+    def load_data(self, data):
         """Replaces internal data structure."""
-        self._data = data
+        self._types = {}
+        self._values = {}
+        self._expiry = {}
+        for key, item in data.items():
+            self._store_item(key, item)
+        self._rebuild_expire_heap()
 
-    async def restore_data(self, data: Dict[str, Any]) -> int:
+    def restore_data(self, data: Dict[str, Any]) -> int:
         """Merges external data into the storage."""
         count = 0
         for key, item in data.items():
             # Item is [type, value, expire_at]
-            if len(item) == 3:
-                # Ensure it is stored as tuple for consistency
-                self._data[key] = tuple(item)
+            if len(item) == 3 and self._store_item(key, item):
                 count += 1
+        self._rebuild_expire_heap()
         return count
@@ -1,9 +1,35 @@
 import asyncio
+import os
 import time
 import json
 import logging
 import argparse
-from typing import Dict, Any, Tuple, Optional, List
+import heapq
+import itertools
+import signal
+import socket
+import sys
+import zlib
+from collections import deque
+from typing import Deque, Dict, Any, Tuple, Optional, List, Iterator
+
+# MessagePack is optional; without it snapshots fall back to JSON.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# orjson is an optional, much faster encoder/decoder for JSON snapshots.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# hiredis is an optional C implementation of the RESP reader used to frame client commands.
+try:
+    import hiredis
+except ImportError:
+    hiredis = None
 
 # --- Logging and Error Classes ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,253 +42,744 @@ class WrongTypeError(TypeError):
     """Custom exception for data type mismatches."""
     pass
 
+class MovedError(CommandError):
+    """Raised for a key owned by another worker; the reply tells the client where to go."""
+    pass
+
+
+# Commands that never mutate the dataset.
+READ_ONLY_COMMANDS = frozenset({b"GET", b"HGET", b"HMGET", b"LRANGE"})
+
+# Arity of every data command: name -> (min_args, max_args).
+# Command names, keys and values stay bytes from the socket to storage and back.
+COMMAND_ARITY = {
+    b"GET": (1, 1),
+    b"SET": (2, 3),
+    b"DELETE": (1, 1),
+    b"EXPIRE": (2, 2),
+    b"LPUSH": (2, sys.maxsize),
+    b"LRANGE": (3, 3),
+    b"HSET": (3, 3),
+    b"HGET": (2, 2),
+    b"HMGET": (2, sys.maxsize),
+}
+
+# Commands that modify the dataset and therefore go to the AOF and to replicas.
+WRITE_COMMANDS = frozenset(COMMAND_ARITY) - READ_ONLY_COMMANDS
+
+# Every command name the server understands, under both usual spellings, mapped to its
+# canonical form so the connection loop can compare names without calling bytes.upper().
+COMMAND_NAMES = {}
+for _name in (*COMMAND_ARITY, b"MULTI", b"EXEC", b"DISCARD", b"REPLICAOF"):
+    COMMAND_NAMES[_name] = COMMAND_NAMES[_name.lower()] = _name
+
+# Inline commands are split at most this many times after the command name, so the
+# final argument (e.g. an HSET value) may contain spaces. SET is split by
+# ProtocolHandler._split_inline_set, since its value comes before an optional TTL.
+INLINE_MAX_SPLIT = {}
+for _name, (_, _max_args) in COMMAND_ARITY.items():
+    INLINE_MAX_SPLIT[_name] = INLINE_MAX_SPLIT[_name.lower()] = _max_args - 1
+
+# Upper bound on keys the active expiration task deletes before yielding to the event loop.
+ACTIVE_EXPIRE_BATCH = 1000
+
+# Bytes requested from the socket per read; every command they contain is served in one pass.
+READ_CHUNK_SIZE = 65536
+
+# Replies are flushed mid-batch once this many bytes are pending, so a pipeline of large
+# replies is streamed out with backpressure instead of being collected in memory first.
+MAX_PIPELINE_BYTES = 65536
+
+# Longest inline command accepted before a newline arrives (the same cap Redis uses).
+INLINE_MAX_SIZE = 64 * 1024
+
+# Bulk strings at least this long are copied out of the read buffer through a memoryview.
+# Slicing the bytearray and converting the slice would copy them twice; below this size the
+# slice is cheaper than setting up the view.
+BULK_VIEW_MIN_SIZE = 8 * 1024
+
+# A replica's full sync is encoded into chunks of about this many bytes, one transport write each.
+FULL_SYNC_CHUNK_BYTES = 1024 * 1024
+
+# Pre-encoded RESP replies, shared instead of being rebuilt for every response.
+RESP_OK = b"+OK\r\n"
+RESP_QUEUED = b"+QUEUED\r\n"
+RESP_NIL = b"_(nil)\r\n"
+
+# Pre-encoded "$N\r\n" bulk headers and ":N\r\n" integer replies for the small values that
+# nearly every reply and replicated argument uses; larger ones are formatted on demand.
+# ignisdb/protocol.py keeps an identical bulk header table for the package server.
+BULK_HEADER_MAX = 4096
+RESP_BULK_HEADERS = tuple(b"$%d\r\n" % n for n in range(BULK_HEADER_MAX + 1))
+INTEGER_REPLY_MAX = 255
+RESP_INTEGERS = tuple(b":%d\r\n" % n for n in range(INTEGER_REPLY_MAX + 1))
+
+# Hash field names repeat across keys (every todo task has the same seven fields), so short
+# ones are shared through one table instead of every hash holding its own copy. The table
+# is bounded so that workloads with unique field names cannot grow it without limit.
+FIELD_INTERN_MAX_LEN = 64
+FIELD_INTERN_MAX_ENTRIES = 4096
+
+# How often the server checks whether a forked snapshot child has finished, in seconds.
+SNAPSHOT_REAP_INTERVAL = 0.05
+
+# Pending AOF bytes are written out after this many seconds, or sooner once the batch grows this large.
+AOF_FLUSH_INTERVAL = 0.001
+AOF_FLUSH_BYTES = 64 * 1024
+
+# Written AOF data is synced to disk at most this often, like Redis' "appendfsync everysec".
+AOF_FSYNC_INTERVAL = 1.0
+
+# fdatasync skips flushing unchanged metadata; platforms without it fall back to fsync.
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+# The MessagePack default applies to this standalone server only. The package server
+# (main.py, ignisdb.conf) writes JSON snapshots and keeps 'ignisdb_snapshot.json'.
+DEFAULT_SNAPSHOT_FILE = 'ignisdb_snapshot.msgpack' if msgpack else 'ignisdb_snapshot.json'
+
+DEFAULT_MASTER_PORT = 6380
+DEFAULT_SLAVE_PORT = 6381
+# With --workers, per-worker ports start this far above the main port unless --worker-port-base is given.
+WORKER_PORT_OFFSET = 100
+
+
+def _parse_int(value: bytes) -> int:
+    """Parses an integer argument, replying with Redis' error for anything that is not one."""
+    try:
+        return int(value)
+    except ValueError:
+        raise CommandError("value is not an integer or out of range") from None
+
+
+def encode_command_into(out: bytearray, command: bytes, *args: Any):
+    """Appends a command encoded as a RESP array to the caller's buffer."""
+    out += b"*%d\r\n$%d\r\n%s\r\n" % (len(args) + 1, len(command), command)
+    for arg in args:
+        # Keys and values are already bytes; only TTLs from a full sync are ints.
+        encoded = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        size = len(encoded)
+        out += RESP_BULK_HEADERS[size] if size <= BULK_HEADER_MAX else b"$%d\r\n" % size
+        out += encoded
+        out += b"\r\n"
+
+
+def encode_command(command: bytes, *args: Any) -> bytes:
+    """Encodes a command as a RESP array, the framing shared by the AOF and replication."""
+    out = bytearray()
+    encode_command_into(out, command, *args)
+    return bytes(out)
+
 
 # --- AOF (Append-Only File) Handler ---
 class AofHandler:
-    """Manages writing commands to the AOF file for persistence."""
+    """
+    Manages writing commands to the AOF file for persistence.
+    Commands are encoded into an in-memory buffer and written out in batches,
+    so a burst of writes costs one write() syscall instead of one per command.
+    Written data is synced to disk once per AOF_FSYNC_INTERVAL from a worker thread.
+    """
     def __init__(self, path: str):
         self._path = path
-        self._file = None
+        self._fd: Optional[int] = None
+        self._buffer = bytearray()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._fsync_handle: Optional[asyncio.TimerHandle] = None
+        # Executor future of the fdatasync in flight, if any.
+        self._fsync_future: Optional[asyncio.Future] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
 
     def open(self):
-        """Opens the AOF file in append mode."""
-        # Open with line buffering (1) to ensure writes are flushed promptly.
-        self._file = open(self._path, 'a', buffering=1)
+        """Opens the AOF file in append mode. Must be called from the running event loop."""
+        # A raw descriptor: each flush() is exactly one os.write() of the batch.
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        self._fd = os.open(self._path, flags, 0o644)
+        self._loop = asyncio.get_running_loop()
         logging.info(f"AOF file '{self._path}' opened for writing.")
 
-    def write(self, command: str, *args: Any):
-        """Writes a command to the AOF file in RESP Array format."""
-        if not self._file:
+    def write_bytes(self, frame: bytes):
+        """Appends an already RESP-encoded command (see encode_command) to the pending batch."""
+        if self._fd is None:
             return
         
-        # Construct the command in RESP (Redis Serialization Protocol) format.
-        parts = [f"*{len(args) + 1}\r\n", f"${len(command)}\r\n{command}\r\n"]
-        for arg in args:
-            arg_str = str(arg)
-            parts.append(f"${len(arg_str)}\r\n{arg_str}\r\n")
-        
-        self._file.write("".join(parts))
-        logging.debug(f"Wrote to AOF: {command} {' '.join(map(str, args))}")
+        buf = self._buffer
+        buf += frame
+        if len(buf) >= AOF_FLUSH_BYTES:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(AOF_FLUSH_INTERVAL, self.flush)
+
+    def write_many(self, frames: List[bytes]):
+        """
+        Appends the frames of a whole transaction at once. The size check runs only after
+        the last frame, so a transaction is never split across two write() calls.
+        """
+        if self._fd is None or not frames:
+            return
+
+        buf = self._buffer
+        for frame in frames:
+            buf += frame
+        if len(buf) >= AOF_FLUSH_BYTES:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(AOF_FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        """Writes every pending command to the file in a single call."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        buf = self._buffer
+        if self._fd is None or not buf:
+            return
+        while buf:
+            # os.write may accept only part of a large batch; keep going until it is all out.
+            written = os.write(self._fd, buf)
+            del buf[:written]
+        if self._fsync_handle is None:
+            self._fsync_handle = self._loop.call_later(AOF_FSYNC_INTERVAL, self._sync)
+
+    def _sync(self):
+        """Syncs everything written so far to disk without blocking the event loop."""
+        self._fsync_handle = None
+        if self._fd is None or self._fsync_future is not None:
+            return
+        self._fsync_future = self._loop.run_in_executor(None, _fdatasync, self._fd)
+        self._fsync_future.add_done_callback(self._sync_done)
+
+    def _sync_done(self, future: asyncio.Future):
+        self._fsync_future = None
+        if not future.cancelled() and future.exception() is not None:
+            logging.error(f"Error syncing AOF file: {future.exception()}")
+
+    async def close(self):
+        """Flushes pending commands, syncs them to disk and closes the AOF file."""
+        if self._fd is None:
+            return
+        # The descriptor must stay open until a background fdatasync is done with it.
+        while self._fsync_future is not None:
+            await asyncio.wait([self._fsync_future])
+        self.flush()
+        if self._fsync_handle is not None:
+            self._fsync_handle.cancel()
+            self._fsync_handle = None
+        _fdatasync(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        logging.info("AOF file closed.")
+
+
+def _atomic_write(path: str, payload: bytes):
+    """
+    Writes payload to a temporary file next to `path`, syncs it to disk and renames it
+    over `path`, so a crash mid-write never leaves a truncated file behind.
+    """
+    tmp_path = path + '.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
 
-    def close(self):
-        """Closes the AOF file."""
-        if self._file:
-            self._file.close()
-            self._file = None
-            logging.info("AOF file closed.")
+
+def _to_text(data: bytes) -> str:
+    """Maps stored bytes onto str for JSON snapshots; invalid UTF-8 survives as lone surrogates."""
+    return data.decode('utf-8', 'surrogateescape')
+
+
+def _from_text(data: Any) -> bytes:
+    """Inverse of _to_text; bytes (from MessagePack snapshots) pass through unchanged."""
+    return data if isinstance(data, bytes) else data.encode('utf-8', 'surrogateescape')
+
+
+def _snapshot_as_text(snapshot: Dict[bytes, Any]) -> Dict[str, Any]:
+    """Converts a snapshot's keys and values to str so it can be written as JSON."""
+    text = {}
+    for key, (type, value, exp) in snapshot.items():
+        if type == 'string':
+            value = _to_text(value)
+        elif type == 'list':
+            value = [_to_text(item) for item in value]
+        else:
+            value = {_to_text(field): _to_text(f_value) for field, f_value in value.items()}
+        text[_to_text(key)] = (type, value, exp)
+    return text
 
 
-# --- Core Storage Engine ---
 class StorageEngine:
     """
     Manages all data, expirations, and persistence operations.
-    Concurrency is handled via an asyncio.Lock.
+    No locks are needed: the server runs on a single event loop and no command
+    implementation awaits, so each one runs to completion before another starts.
     """
     def __init__(self, snapshot_path: str, aof_handler: Optional[AofHandler]):
-        # Data format: { key: (type, value, expiration_timestamp) }
-        self._data: Dict[str, Tuple[str, Any, Optional[float]]] = {}
-        self._lock = asyncio.Lock()
+        # Data lives in one dict per type, so a lookup in the right dict is also the type check.
+        # A key is present in at most one of them.
+        self._strings: Dict[bytes, bytes] = {}
+        self._lists: Dict[bytes, deque] = {}
+        self._hashes: Dict[bytes, Dict[bytes, bytes]] = {}
+        # Shared hash field name objects, see _intern_field().
+        self._field_names: Dict[bytes, bytes] = {}
+        # Expiration timestamps for keys that have a TTL. They use time.monotonic(),
+        # so wall-clock jumps cannot expire keys early.
+        self._expiry: Dict[bytes, float] = {}
+        # Cached monotonic clock used by commands. It is refreshed once per batch of commands
+        # (see refresh_clock), so a pipeline reads the clock once rather than once per command.
+        self.now = time.monotonic()
+        # Min-heap of (expiration_time, key) feeding the active expiration task. Entries are
+        # never removed eagerly; stale ones are skipped once their time comes.
+        self._ttl_heap: List[Tuple[float, bytes]] = []
+        self._ttl_wakeup = asyncio.Event()
         self._snapshot_path = snapshot_path
+        # Set while a snapshot is being written, so a second save never races the first.
+        self._bgsave_inflight = False
         self._aof = aof_handler
+        # Dispatch table: command -> (handler, min_args, max_args, name, read_only)
+        # The command set is fixed, so both usual spellings are keyed up front and the
+        # common case is a single dict hit with no per-request bytes.upper().
+        self._handlers = {}
+        for name, (min_args, max_args) in COMMAND_ARITY.items():
+            method = getattr(self, f"_exec_{name.decode()}")
+            spec = (method, min_args, max_args, name, name in READ_ONLY_COMMANDS)
+            self._handlers[name] = spec
+            self._handlers[name.lower()] = spec
+        # Per-command runners, each specialized for its command (see _make_runner) and keyed
+        # the same way as _handlers. The connection loop calls them directly: its command
+        # names are already canonical, so this saves a call through execute_command.
+        self.command_runners = {}
+        for key, spec in self._handlers.items():
+            self.command_runners[key] = self._make_runner(*spec)
+
+    def _make_runner(self, method, min_args: int, max_args: int, name: bytes, read_only: bool):
+        """
+        Builds the function execute_command calls for one command. The method, arity bounds,
+        error message and AOF path are bound once here, so a call does no tuple unpacking
+        and read-only commands skip the persistence branch entirely.
+        """
+        arity_error = f"wrong number of arguments for '{name.decode().lower()}' command"
+
+        if read_only:
+            def run(args, propagate_func):
+                if not min_args <= len(args) <= max_args:
+                    raise CommandError(arity_error)
+                return method(*args)
+            return run
+
+        aof_write = self._aof.write_bytes if self._aof else None
+
+        def run(args, propagate_func):
+            if not min_args <= len(args) <= max_args:
+                raise CommandError(arity_error)
+            result = method(*args)
+            # Persist the write and queue it for the replicas, encoding it only once for both.
+            if aof_write or propagate_func:
+                frame = encode_command(name, *args)
+                if aof_write:
+                    aof_write(frame)
+                if propagate_func:
+                    propagate_func(frame)
+            return result
+        return run
+
+    def refresh_clock(self):
+        """Updates the cached clock. Called before each batch of commands is executed."""
+        self.now = time.monotonic()
 
-    async def _check_and_delete_expired_unlocked(self, key: str) -> bool:
+    def _check_and_delete_expired_unlocked(self, key: bytes, now: Optional[float] = None) -> bool:
         """
         Internal helper to check for key expiration and delete if needed.
-        This version does not acquire the lock, assuming it's already held.
+        Uses the cached clock unless the caller passes `now`.
         """
-        item = self._data.get(key)
-        if item:
-            _, _, expiration_time = item
-            if expiration_time is not None and time.time() > expiration_time:
-                logging.info(f"Key '{key}' has expired. Deleting.")
-                del self._data[key]
-                return True
+        expiration_time = self._expiry.get(key)
+        if expiration_time is not None and (now if now is not None else self.now) > expiration_time:
+            logging.info("Key '%s' has expired. Deleting.", key)
+            self._delete_unlocked(key)
+            return True
         return False
 
-    async def execute_command(self, command: str, args: List[Any], propagate_func=None):
+    def _delete_unlocked(self, key: bytes) -> bool:
+        """Removes a key of any type along with its TTL. Returns whether it existed."""
+        self._expiry.pop(key, None)
+        return (self._strings.pop(key, None) is not None
+                or self._lists.pop(key, None) is not None
+                or self._hashes.pop(key, None) is not None)
+
+    def _exists_unlocked(self, key: bytes) -> bool:
+        """Returns whether the key holds a value of any type."""
+        return key in self._strings or key in self._lists or key in self._hashes
+
+    def _schedule_expiration(self, key: bytes, expiration_time: float):
+        """Registers a TTL with the active expiration task, waking it if this key is now due first."""
+        heapq.heappush(self._ttl_heap, (expiration_time, key))
+        if self._ttl_heap[0][0] == expiration_time:
+            self._ttl_wakeup.set()
+
+    async def run_active_expiration(self):
+        """
+        Background task that deletes keys as soon as their TTL passes, so keys that are never
+        read again do not pile up in memory. It sleeps until the earliest pending expiration.
+        """
+        while True:
+            heap = self._ttl_heap
+            now = time.monotonic()
+            deleted = 0
+            while heap and heap[0][0] <= now and deleted < ACTIVE_EXPIRE_BATCH:
+                expiration_time, key = heapq.heappop(heap)
+                # Skip entries for keys that were deleted, overwritten or given a new TTL since.
+                if self._expiry.get(key) == expiration_time:
+                    self._delete_unlocked(key)
+                    deleted += 1
+            if heap and heap[0][0] <= now:
+                await asyncio.sleep(0)  # More keys are due; let clients in between batches.
+                continue
+            self._ttl_wakeup.clear()
+            try:
+                await asyncio.wait_for(self._ttl_wakeup.wait(), heap[0][0] - now if heap else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def execute_command(self, command: bytes, args: List[bytes], propagate_func=None):
         """
         Central dispatcher for executing a single command.
-        It acquires the lock and calls the appropriate internal method.
+        It validates arity and calls the appropriate internal method.
         """
-        command_upper = command.upper()
-        method_name = f"_exec_{command_upper}"
-        if not hasattr(self, method_name):
-            raise CommandError(f"Unknown command '{command}'")
-        
-        method = getattr(self, method_name)
-        
-        async with self._lock:
-            # Expired keys are handled lazily within each command implementation.
-            result = await method(*args)
-            
-            is_write_command = command_upper in ["SET", "DELETE", "EXPIRE", "LPUSH", "HSET"]
-            if is_write_command:
-                # If the command was a write, persist it.
-                if self._aof:
-                    self._aof.write(command, *args)
-                # And propagate it to replicas.
-                if propagate_func:
-                    await propagate_func(command, *args)
-            return result
+        run = self.command_runners.get(command)
+        if run is None:
+            # Mixed-case spellings fall back to normalizing the name.
+            run = self.command_runners.get(command.upper())
+            if run is None:
+                raise CommandError(f"Unknown command '{command.decode('utf-8', 'replace')}'")
+        # Expired keys are handled lazily within each command implementation.
+        return run(args, propagate_func)
 
-    async def execute_transaction(self, command_queue: List[Tuple[str, List[Any]]], propagate_func=None):
+    def execute_transaction(self, command_queue: List[Tuple[bytes, List[bytes]]], propagate_func=None):
         """
         Executes a list of commands from a MULTI/EXEC block atomically.
         """
         results = []
         write_commands_in_txn = []
 
-        async with self._lock:
-            # All commands in a transaction are executed under a single lock.
-            for command, args in command_queue:
-                command_upper = command.upper()
-                method_name = f"_exec_{command_upper}"
-                if not hasattr(self, method_name):
-                    raise CommandError(f"Unknown command '{command}' in transaction")
-                
-                method = getattr(self, method_name)
+        # The commands run back to back without awaiting, so no other client can interleave.
+        for command, args in command_queue:
+            handler = self._handlers.get(command) or self._handlers.get(command.upper())
+            if handler is None:
+                raise CommandError(f"Unknown command '{command.decode('utf-8', 'replace')}' in transaction")
+            method, min_args, max_args, name, read_only = handler
+            
+            try:
+                if not min_args <= len(args) <= max_args:
+                    raise CommandError(f"wrong number of arguments for '{name.decode().lower()}' command")
+                result = method(*args)
+                results.append(result)
                 
-                try:
-                    result = await method(*args)
-                    results.append(result)
-                    
-                    is_write_command = command_upper in ["SET", "DELETE", "EXPIRE", "LPUSH", "HSET"]
-                    if is_write_command:
-                        write_commands_in_txn.append((command, args))
+                if not read_only:
+                    write_commands_in_txn.append((name, args))
 
-                except Exception as e:
-                    # If any command fails, the entire transaction is aborted. No changes are kept.
-                    logging.warning(f"Transaction failed on command '{command}': {e}. Rolling back.")
-                    raise CommandError(f"Transaction aborted: {e}")
-
-            # If the entire transaction succeeded, persist and propagate the write commands.
-            for cmd, ags in write_commands_in_txn:
-                if self._aof:
-                    self._aof.write(cmd, *ags)
-                if propagate_func:
-                    await propagate_func(cmd, *ags)
+            except Exception as e:
+                # If any command fails, the entire transaction is aborted. No changes are kept.
+                logging.warning("Transaction failed on command '%s': %s. Rolling back.", command.decode('utf-8', 'replace'), e)
+                raise CommandError(f"Transaction aborted: {e}")
+
+        # If the entire transaction succeeded, persist and propagate the write commands.
+        if (self._aof or propagate_func) and write_commands_in_txn:
+            frames = [encode_command(cmd, *ags) for cmd, ags in write_commands_in_txn]
+            if self._aof:
+                self._aof.write_many(frames)
+            if propagate_func:
+                for frame in frames:
+                    propagate_func(frame)
         
         return results
 
-    # --- LOCKED Command Implementations (called by the dispatcher) ---
+    # --- Command Implementations (called by the dispatcher) ---
     
-    async def _exec_GET(self, key: str):
-        if await self._check_and_delete_expired_unlocked(key): return None
-        item = self._data.get(key)
-        if item is None: return None
-        type, value, _ = item
-        if type != 'string': raise WrongTypeError("Operation against a key holding the wrong kind of value")
+    def _exec_GET(self, key: bytes):
+        if self._check_and_delete_expired_unlocked(key): return None
+        value = self._strings.get(key)
+        if value is None and (key in self._lists or key in self._hashes):
+            raise WrongTypeError("Operation against a key holding the wrong kind of value")
         return value
 
-    async def _exec_SET(self, key: str, value: Any, expire_in_seconds: Optional[str] = None):
+    def _exec_SET(self, key: bytes, value: bytes, expire_in_seconds: Optional[bytes] = None):
         expiration_time = None
         if expire_in_seconds is not None:
-            expiration_time = time.time() + int(expire_in_seconds)
-        self._data[key] = ('string', value, expiration_time)
+            expiration_time = self.now + _parse_int(expire_in_seconds)
+        if key not in self._strings:
+            # SET replaces a key of any type.
+            self._lists.pop(key, None)
+            self._hashes.pop(key, None)
+        self._strings[key] = value
+        if expiration_time is not None:
+            self._expiry[key] = expiration_time
+            self._schedule_expiration(key, expiration_time)
+        else:
+            self._expiry.pop(key, None)
         return "OK"
 
-    async def _exec_DELETE(self, key: str):
-        if await self._check_and_delete_expired_unlocked(key): return 1
-        if key in self._data:
-            del self._data[key]
-            return 1
-        return 0
+    def _exec_DELETE(self, key: bytes):
+        # One pass: drop the key and its TTL, and only count it if it had not already expired.
+        expiration_time = self._expiry.get(key)
+        if not self._delete_unlocked(key): return 0
+        return 0 if expiration_time is not None and self.now > expiration_time else 1
 
-    async def _exec_EXPIRE(self, key: str, seconds: str):
-        if await self._check_and_delete_expired_unlocked(key) or key not in self._data: return 0
-        type, value, _ = self._data[key]
-        self._data[key] = (type, value, time.time() + int(seconds))
+    def _exec_EXPIRE(self, key: bytes, seconds: bytes):
+        now = self.now
+        if self._check_and_delete_expired_unlocked(key, now): return 0
+        if not self._exists_unlocked(key): return 0
+        expiration_time = now + _parse_int(seconds)
+        self._expiry[key] = expiration_time
+        self._schedule_expiration(key, expiration_time)
         return 1
     
-    async def _exec_LPUSH(self, key: str, *values: List[str]):
-        await self._check_and_delete_expired_unlocked(key)
-        item = self._data.get(key)
-        if item is None:
-            new_list = list(reversed(values))
-            self._data[key] = ('list', new_list, None)
-            return len(new_list)
-        type, current_list, _ = item
-        if type != 'list': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        current_list[:0] = reversed(values)
+    def _exec_LPUSH(self, key: bytes, *values: bytes):
+        self._check_and_delete_expired_unlocked(key)
+        current_list = self._lists.get(key)
+        if current_list is None:
+            if key in self._strings or key in self._hashes:
+                raise WrongTypeError("Operation against a key holding the wrong kind of value")
+            # Lists are deques so that prepending is O(1); extendleft() pushes each value
+            # to the head in turn, which is exactly LPUSH ordering.
+            current_list = self._lists[key] = deque()
+        current_list.extendleft(values)
         return len(current_list)
 
-    async def _exec_LRANGE(self, key: str, start: str, stop: str):
-        start_idx, stop_idx = int(start), int(stop)
-        if await self._check_and_delete_expired_unlocked(key): return []
-        item = self._data.get(key)
-        if item is None: return []
-        type, current_list, _ = item
-        if type != 'list': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        if stop_idx == -1: return current_list[start_idx:]
-        return current_list[start_idx : stop_idx + 1]
-
-    async def _exec_HSET(self, key: str, field: str, value: str):
-        await self._check_and_delete_expired_unlocked(key)
-        item = self._data.get(key)
-        if item is None:
-            self._data[key] = ('hash', {field: value}, None)
+    def _exec_LRANGE(self, key: bytes, start: bytes, stop: bytes):
+        start_idx, stop_idx = _parse_int(start), _parse_int(stop)
+        if self._check_and_delete_expired_unlocked(key): return []
+        current_list = self._lists.get(key)
+        if current_list is None:
+            if key in self._strings or key in self._hashes:
+                raise WrongTypeError("Operation against a key holding the wrong kind of value")
+            return []
+        # deques cannot be sliced; resolve negative indexes against the length first.
+        length = len(current_list)
+        if start_idx < 0: start_idx = max(length + start_idx, 0)
+        if stop_idx < 0: stop_idx += length
+        if start_idx > stop_idx: return []
+        return list(itertools.islice(current_list, start_idx, stop_idx + 1))
+
+    def _intern_field(self, field: bytes) -> bytes:
+        """Returns the shared object for a hash field name, registering short new names."""
+        names = self._field_names
+        shared = names.get(field)
+        if shared is not None:
+            return shared
+        if len(field) <= FIELD_INTERN_MAX_LEN and len(names) < FIELD_INTERN_MAX_ENTRIES:
+            names[field] = field
+        return field
+
+    def _exec_HSET(self, key: bytes, field: bytes, value: bytes):
+        self._check_and_delete_expired_unlocked(key)
+        current_hash = self._hashes.get(key)
+        if current_hash is None:
+            if key in self._strings or key in self._lists:
+                raise WrongTypeError("Operation against a key holding the wrong kind of value")
+            self._hashes[key] = {self._intern_field(field): value}
             return 1
-        type, current_hash, _ = item
-        if type != 'hash': raise WrongTypeError("Operation against a key holding the wrong kind of value")
-        is_new = 1 if field not in current_hash else 0
-        current_hash[field] = value
-        return is_new
-
-    async def _exec_HGET(self, key: str, field: str):
-        if await self._check_and_delete_expired_unlocked(key): return None
-        item = self._data.get(key)
-        if item is None: return None
-        type, current_hash, _ = item
-        if type != 'hash': raise WrongTypeError("Operation against a key holding the wrong kind of value")
+        if field in current_hash:
+            # Overwriting keeps the dict's existing key object.
+            current_hash[field] = value
+            return 0
+        current_hash[self._intern_field(field)] = value
+        return 1
+
+    def _exec_HGET(self, key: bytes, field: bytes):
+        if self._check_and_delete_expired_unlocked(key): return None
+        current_hash = self._hashes.get(key)
+        if current_hash is None:
+            if key in self._strings or key in self._lists:
+                raise WrongTypeError("Operation against a key holding the wrong kind of value")
+            return None
         return current_hash.get(field)
 
+    def _exec_HMGET(self, key: bytes, *fields: bytes):
+        # One expiry check and one lookup for every field, instead of one HGET per field.
+        if self._check_and_delete_expired_unlocked(key): return [None] * len(fields)
+        current_hash = self._hashes.get(key)
+        if current_hash is None:
+            if key in self._strings or key in self._lists:
+                raise WrongTypeError("Operation against a key holding the wrong kind of value")
+            return [None] * len(fields)
+        return [current_hash.get(field) for field in fields]
+
     # --- Persistence and Replication Helpers ---
 
-    async def get_all_data_as_commands(self) -> List[Tuple[str, List[Any]]]:
-        """Returns a list of commands to reconstruct the current dataset (for replication sync)."""
-        commands = []
-        async with self._lock:
-            for key, (type, value, exp) in self._data.items():
-                if await self._check_and_delete_expired_unlocked(key):
-                    continue
-                if type == 'string':
-                    commands.append(("SET", [key, value]))
-                elif type == 'list':
-                    if value: commands.append(("LPUSH", [key] + list(reversed(value))))
-                elif type == 'hash':
-                    for field, f_value in value.items():
-                        commands.append(("HSET", [key, field, f_value]))
-                
-                if exp:
-                    ttl = int(exp - time.time())
-                    if ttl > 0:
-                        commands.append(("EXPIRE", [key, ttl]))
-        return commands
+    def get_all_data_as_commands(self) -> Iterator[Tuple[bytes, List[Any]]]:
+        """
+        Yields the commands that reconstruct the current dataset (for replication sync).
+        The caller must consume it without awaiting, as it walks the live dicts.
+        """
+        now = time.monotonic()
+        expired = [key for key, expiration_time in self._expiry.items() if now > expiration_time]
+        for key in expired:
+            self._delete_unlocked(key)
+        for key, value in self._strings.items():
+            yield b"SET", [key, value]
+        for key, value in self._lists.items():
+            if value: yield b"LPUSH", [key, *reversed(value)]
+        for key, value in self._hashes.items():
+            for field, f_value in value.items():
+                yield b"HSET", [key, field, f_value]
+        for key, exp in self._expiry.items():
+            ttl = int(exp - now)
+            if ttl > 0:
+                yield b"EXPIRE", [key, ttl]
+
+    def _snapshot_uses_msgpack(self, path: Optional[str] = None) -> bool:
+        """Snapshots ending in '.msgpack' are binary MessagePack; anything else is JSON."""
+        if not (path or self._snapshot_path).endswith('.msgpack'):
+            return False
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed (pip install msgpack)")
+        return True
 
     async def save_snapshot(self):
-        """Saves the entire database to a JSON snapshot file."""
-        async with self._lock:
-            logging.info("Cleaning expired keys before snapshotting...")
-            # Create a list of keys to avoid iterating over a changing dictionary
-            all_keys = list(self._data.keys())
-            for key in all_keys:
-                await self._check_and_delete_expired_unlocked(key)
+        """
+        Saves the entire database to a MessagePack or JSON snapshot file.
+        Where fork() is available the file is written by a child process that sees a
+        copy-on-write image of the dataset, so the server never pauses to copy it.
+        A call made while another snapshot is still being written is skipped.
+        """
+        if self._bgsave_inflight:
+            logging.warning("A snapshot is already being saved; skipping this one.")
+            return
+        logging.info("Cleaning expired keys before snapshotting...")
+        # Only keys with a TTL can expire. Find them in one comprehension pass over the
+        # expiry dict, then delete just those instead of checking every key in Python.
+        now = time.monotonic()
+        expired = [key for key, expiration_time in self._expiry.items() if now > expiration_time]
+        for key in expired:
+            self._delete_unlocked(key)
+        self._bgsave_inflight = True
+        try:
+            if hasattr(os, 'fork'):
+                await self._save_snapshot_in_child()
+            else:
+                await asyncio.to_thread(self._write_snapshot_file, self._build_snapshot())
+            logging.info(f"Database snapshot successfully saved to '{self._snapshot_path}'.")
+        except Exception as e:
+            logging.error(f"Error saving snapshot: {e}")
+        finally:
+            self._bgsave_inflight = False
+
+    async def _save_snapshot_in_child(self):
+        """Forks a child that writes the snapshot and exits, then reaps it without blocking the loop."""
+        self._snapshot_uses_msgpack()  # Surface a missing serializer here rather than in the child.
+        pid = os.fork()
+        if pid == 0:
+            # Child: serialize straight from the inherited memory and leave without running
+            # any of the parent's cleanup (AOF flush, sockets, event loop).
+            status = 1
             try:
-                with open(self._snapshot_path, 'w') as f:
-                    json.dump(self._data, f)
-                logging.info(f"Database snapshot successfully saved to '{self._snapshot_path}'.")
-            except Exception as e:
-                logging.error(f"Error saving snapshot: {e}")
+                self._write_snapshot_file(self._build_snapshot(copy=False))
+                status = 0
+            except BaseException:
+                logging.exception(f"Snapshot child process {os.getpid()} failed")
+            finally:
+                os._exit(status)
+        while True:
+            reaped, wait_status = os.waitpid(pid, os.WNOHANG)
+            if reaped:
+                break
+            await asyncio.sleep(SNAPSHOT_REAP_INTERVAL)
+        exit_code = os.waitstatus_to_exitcode(wait_status)
+        if exit_code != 0:
+            raise RuntimeError(f"snapshot child process exited with status {exit_code}")
+
+    def _build_snapshot(self, copy: bool = True) -> Dict[bytes, Any]:
+        """
+        Returns the dataset in its on-disk layout: every key maps to [type, value, expiration].
+        With copy=False hashes are shared with the live dataset, which is only safe in a
+        forked child that never sees another write.
+        """
+        # Lists and hashes are mutated in place, so they are copied as well before another
+        # coroutine can touch them; list deques are copied out as plain lists so every
+        # serializer can handle them.
+        # Expirations are monotonic in memory but stored as wall-clock timestamps on disk.
+        to_wall_clock = time.time() - time.monotonic()
+        expiry = {key: exp + to_wall_clock for key, exp in self._expiry.items()}
+        snapshot = {key: ('string', value, expiry.get(key)) for key, value in self._strings.items()}
+        snapshot.update((key, ('list', list(value), expiry.get(key))) for key, value in self._lists.items())
+        snapshot.update((key, ('hash', value.copy() if copy else value, expiry.get(key)))
+                        for key, value in self._hashes.items())
+        return snapshot
+
+    def _write_snapshot_file(self, snapshot: Dict[bytes, Any]):
+        """Serializes a snapshot copy off the event loop, then atomically replaces the old file."""
+        if self._snapshot_uses_msgpack():
+            # MessagePack stores the bytes as-is.
+            payload = msgpack.packb(snapshot, use_bin_type=True)
+        else:
+            snapshot = _snapshot_as_text(snapshot)
+            try:
+                if orjson is None:
+                    raise TypeError
+                payload = orjson.dumps(snapshot, option=orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                # orjson rejects the surrogates that carry non-UTF-8 bytes; json escapes them.
+                payload = json.dumps(snapshot).encode('utf-8')
+        _atomic_write(self._snapshot_path, payload)
+
+    def _legacy_snapshot_path(self) -> Optional[str]:
+        """
+        The JSON snapshot an older server wrote before the default became '.msgpack',
+        when it exists and the '.msgpack' one does not.
+        """
+        path = self._snapshot_path
+        if not path.endswith('.msgpack') or os.path.exists(path):
+            return None
+        legacy_path = path[:-len('.msgpack')] + '.json'
+        return legacy_path if os.path.exists(legacy_path) else None
 
     async def load_from_snapshot(self):
-        """Loads the database from a JSON snapshot file."""
+        """Loads the database from a MessagePack or JSON snapshot file."""
+        path = self._snapshot_path
+        legacy_path = self._legacy_snapshot_path()
+        if legacy_path:
+            logging.warning(f"Snapshot file '{path}' not found; loading legacy JSON snapshot '{legacy_path}'. New snapshots are saved to '{path}'.")
+            path = legacy_path
         try:
-            with open(self._snapshot_path, 'r') as f:
-                async with self._lock:
-                    self._data = json.load(f)
-                logging.info(f"Database successfully loaded from '{self._snapshot_path}'.")
+            if self._snapshot_uses_msgpack(path):
+                with open(path, 'rb') as f:
+                    raw_data = msgpack.unpack(f, raw=False, strict_map_key=False)
+            else:
+                with open(path, 'rb') as f:
+                    payload = f.read()
+                try:
+                    if orjson is None:
+                        raise ValueError
+                    raw_data = orjson.loads(payload)
+                except ValueError:
+                    raw_data = json.loads(payload)
+            # Entries are stored as [type, value, expiration]; map the stored wall-clock
+            # expirations back onto the monotonic clock. JSON (and older MessagePack)
+            # snapshots hold text, which is turned back into bytes.
+            to_monotonic = time.monotonic() - time.time()
+            self._strings, self._lists, self._hashes, self._expiry = {}, {}, {}, {}
+            self._field_names = {}
+            for key, (type, value, exp) in raw_data.items():
+                key = _from_text(key)
+                if type == 'string':
+                    self._strings[key] = _from_text(value)
+                elif type == 'list':
+                    self._lists[key] = deque(map(_from_text, value))
+                elif type == 'hash':
+                    intern = self._intern_field
+                    self._hashes[key] = {intern(_from_text(field)): _from_text(f_value) for field, f_value in value.items()}
+                else:
+                    continue
+                if exp is not None:
+                    self._expiry[key] = exp + to_monotonic
+            self._ttl_heap = [(exp, key) for key, exp in self._expiry.items()]
+            heapq.heapify(self._ttl_heap)
+            self._ttl_wakeup.set()
+            logging.info(f"Database successfully loaded from '{path}'.")
         except FileNotFoundError:
-            logging.warning(f"Snapshot file '{self._snapshot_path}' not found. Starting with an empty database.")
+            logging.warning(f"Snapshot file '{path}' not found. Starting with an empty database.")
         except Exception as e:
             logging.error(f"Error loading snapshot: {e}")
 
@@ -271,43 +788,239 @@ class StorageEngine:
 class ProtocolHandler:
     """Parses raw client data into commands and formats responses into RESP."""
     
-    def parse_command(self, command_raw: str) -> Tuple[str, List[str]]:
-        """Parses a raw string command into a (command, [args]) tuple."""
-        parts = command_raw.strip().split()
+    def parse_command(self, command_raw: bytes) -> Tuple[bytes, List[bytes]]:
+        """
+        Parses a raw command into a (command, [args]) tuple.
+        Accepts binary-safe RESP arrays (*N\r\n$L\r\n<arg>\r\n...) as sent by
+        redis-style clients, falling back to the whitespace-separated inline form.
+        """
+        if command_raw[:1] == b'*':
+            return self._parse_resp_array(command_raw)
+        head = command_raw.split(None, 1)
+        if not head:
+            raise CommandError("Empty command")
+        command = head[0]
+        if len(head) == 1:
+            return command, []
+        if command == b"SET" or command == b"set":
+            return command, self._split_inline_set(head[1].rstrip())
+        # Stop tokenizing once the command's last argument is reached.
+        max_split = INLINE_MAX_SPLIT.get(command, -1)
+        return command, head[1].rstrip().split(None, max_split)
+
+    @staticmethod
+    def _split_inline_set(rest: bytes) -> List[bytes]:
+        """
+        Splits inline SET arguments into key, value and optional TTL. The value keeps its
+        spaces; a trailing integer after it is taken as the TTL, as 'SET k v 100' always was.
+        """
+        args = rest.split(None, 1)
+        if len(args) == 2:
+            value_ttl = args[1].rsplit(None, 1)
+            if len(value_ttl) == 2 and value_ttl[1].lstrip(b"-").isdigit():
+                args[1:] = value_ttl
+        return args
+
+    def _parse_resp_array(self, command_raw: bytes) -> Tuple[bytes, List[bytes]]:
+        """Scans a RESP array by its length prefixes, slicing each argument out of the buffer once."""
+        eol = command_raw.find(b'\r\n')
+        if eol == -1:
+            raise CommandError("Protocol error: incomplete multibulk header")
+        num_args = int(command_raw[1:eol])
+        if num_args < -1:
+            raise CommandError("Protocol error: invalid multibulk length")
+        pos = eol + 2
+        parts = []
+        for _ in range(num_args):
+            eol = command_raw.find(b'\r\n', pos)
+            if eol == -1 or command_raw[pos:pos + 1] != b'$':
+                raise CommandError("Protocol error: expected '$' bulk string header")
+            length = int(command_raw[pos + 1:eol])
+            if length < 0:
+                raise CommandError("Protocol error: invalid bulk length")
+            start = eol + 2
+            end = start + length
+            if end > len(command_raw):
+                raise CommandError("Protocol error: incomplete bulk string")
+            if command_raw[end:end + 2] != b'\r\n':
+                raise CommandError("Protocol error: expected CRLF after bulk string")
+            parts.append(command_raw[start:end])
+            pos = end + 2
         if not parts:
             raise CommandError("Empty command")
         return parts[0], parts[1:]
 
-    def format_response(self, result: Any) -> str:
-        """Formats a Python object into a RESP string for the client."""
+    def format_response(self, result: Any, out: bytearray):
+        """Appends the RESP encoding of a Python object to the caller's output buffer."""
         if result is None:
-            return "_(nil)\r\n"
+            out += RESP_NIL
+        elif isinstance(result, bytes):
+            # Stored values are raw bytes and go out unchanged.
+            size = len(result)
+            out += RESP_BULK_HEADERS[size] if size <= BULK_HEADER_MAX else b"$%d\r\n" % size
+            out += result
+            out += b"\r\n"
         elif isinstance(result, str):
-            if result == "OK" or result == "QUEUED":
-                return f"+{result}\r\n"
-            return f"${len(result)}\r\n{result}\r\n"
+            if result == "OK":
+                out += RESP_OK
+            elif result == "QUEUED":
+                out += RESP_QUEUED
+            else:
+                encoded = result.encode('utf-8')
+                size = len(encoded)
+                out += RESP_BULK_HEADERS[size] if size <= BULK_HEADER_MAX else b"$%d\r\n" % size
+                out += encoded
+                out += b"\r\n"
         elif isinstance(result, int):
-            return f":{result}\r\n"
+            if 0 <= result <= INTEGER_REPLY_MAX:
+                out += RESP_INTEGERS[result]
+            else:
+                out += b":%d\r\n" % result
         elif isinstance(result, list):
             # Recursively format items in a list (for LRANGE, EXEC)
-            response_parts = [f"*{len(result)}\r\n"]
+            out += b"*%d\r\n" % len(result)
             for item in result:
-                response_parts.append(self.format_response(item))
-            return "".join(response_parts)
+                self.format_response(item, out)
         elif isinstance(result, Exception):
+            if isinstance(result, MovedError):
+                # Sent bare ("-MOVED <shard> <host>:<port>") so cluster-aware clients can follow it.
+                out += f"-{str(result)}\r\n".encode('utf-8')
+                return
             err_type = "WRONGTYPE" if isinstance(result, WrongTypeError) else "ERR"
-            return f"-{err_type} {str(result)}\r\n"
+            out += f"-{err_type} {str(result)}\r\n".encode('utf-8')
         else:
             logging.error(f"Cannot format unknown response type: {type(result)}")
-            return f"-ERR Server error: cannot format response\r\n"
+            out += b"-ERR Server error: cannot format response\r\n"
 
-    def format_command_as_bytes(self, command: str, *args: Any) -> bytes:
+    def format_command_as_bytes(self, command: bytes, *args: Any) -> bytes:
         """Formats a command and arguments into a RESP byte string (for replication)."""
-        parts = [f"*{len(args) + 1}\r\n", f"${len(command)}\r\n{command}\r\n"]
-        for arg in args:
-            arg_str = str(arg)
-            parts.append(f"${len(arg_str)}\r\n{arg_str}\r\n")
-        return "".join(parts).encode('utf-8')
+        return encode_command(command, *args)
+
+
+class RespStreamParser:
+    """
+    Incrementally frames client commands out of a byte stream.
+    Data from each socket read is appended to a buffer and every complete
+    command in it is handed out in turn; a partial command stays buffered
+    until the rest of it arrives.
+    """
+    def __init__(self, protocol: ProtocolHandler):
+        self._protocol = protocol
+        self._buf = bytearray()
+        self._pos = 0
+
+    def feed(self, data: bytes):
+        """Appends freshly read bytes to the buffer."""
+        self._buf += data
+
+    def next_command(self, eof: bool = False) -> Optional[Tuple[bytes, List[bytes]]]:
+        """
+        Returns the next complete (command, [args]) tuple, or None if more data is needed.
+        At EOF a trailing inline command without a newline is still returned.
+        Raises CommandError or ValueError on malformed input.
+        """
+        buf = self._buf
+        pos = self._pos
+        while True:
+            if pos >= len(buf):
+                buf.clear()
+                self._pos = 0
+                return None
+            if buf[pos] == 42:  # b'*'
+                break
+            eol = buf.find(b'\n', pos)
+            if eol == -1:
+                if eof:
+                    eol = len(buf)
+                elif len(buf) - pos > INLINE_MAX_SIZE:
+                    raise CommandError("too big inline request")
+                else:
+                    return self._need_more(pos)
+            line = bytes(buf[pos:eol])
+            pos = eol + 1
+            if line.strip():
+                self._pos = pos
+                return self._protocol.parse_command(line)
+            # Blank lines between inline commands are ignored.
+
+        # RESP array: *N\r\n followed by N bulk strings $L\r\n<L bytes>\r\n.
+        eol = buf.find(b'\r\n', pos)
+        if eol == -1:
+            return self._need_more(pos)
+        num_args = int(buf[pos + 1:eol])
+        if num_args < -1:
+            raise CommandError("invalid multibulk length")
+        cursor = eol + 2
+        parts = []
+        for _ in range(num_args):
+            eol = buf.find(b'\r\n', cursor)
+            if eol == -1:
+                return self._need_more(pos)
+            if buf[cursor] != 36:  # b'$'
+                raise CommandError("expected '$' bulk string header")
+            # A null bulk string ($-1) is a reply, never a command argument.
+            length = int(buf[cursor + 1:eol])
+            if length < 0:
+                raise CommandError("invalid bulk length")
+            start = eol + 2
+            end = start + length
+            if end + 2 > len(buf):
+                return self._need_more(pos)
+            if buf[end:end + 2] != b"\r\n":
+                raise CommandError("expected CRLF after bulk string")
+            if end - start >= BULK_VIEW_MIN_SIZE:
+                with memoryview(buf) as view:
+                    parts.append(bytes(view[start:end]))
+            else:
+                parts.append(bytes(buf[start:end]))
+            cursor = end + 2
+        self._pos = cursor
+        if not parts:
+            raise CommandError("Empty command")
+        return parts[0], parts[1:]
+
+    def _need_more(self, pos: int) -> None:
+        """Drops everything before the incomplete command at `pos` and waits for more data."""
+        if pos:
+            del self._buf[:pos]
+        self._pos = 0
+        return None
+
+
+class HiredisStreamParser:
+    """
+    Drop-in replacement for RespStreamParser that frames RESP arrays with hiredis' C reader.
+    hiredis only understands RESP, so it is used for connections that open with an array,
+    which is what every client library sends; inline commands keep the Python parser.
+    """
+    def __init__(self):
+        self._reader = hiredis.Reader(protocolError=CommandError, replyError=CommandError)
+
+    def feed(self, data: bytes):
+        """Hands freshly read bytes to the hiredis reader."""
+        if data:
+            self._reader.feed(data)
+
+    def next_command(self, eof: bool = False) -> Optional[Tuple[bytes, List[bytes]]]:
+        """Returns the next complete (command, [args]) tuple, or None if more data is needed."""
+        frame = self._reader.gets()
+        if frame is False:
+            return None
+        if type(frame) is not list:
+            raise CommandError("expected '*' multibulk header")
+        if not frame:
+            raise CommandError("Empty command")
+        for part in frame:
+            if type(part) is not bytes:
+                raise CommandError("expected '$' bulk string header")
+        return frame[0], frame[1:]
+
+
+def make_stream_parser(protocol: ProtocolHandler, first_chunk: bytes):
+    """Picks the parser for a connection from the first bytes it sent."""
+    if hiredis is not None and first_chunk[:1] == b'*':
+        return HiredisStreamParser()
+    return RespStreamParser(protocol)
 
 
 class ReplicationManager:
@@ -324,160 +1037,407 @@ class ReplicationManager:
         peername = writer.get_extra_info('peername')
         logging.info(f"New replica connection from {peername}. Starting full sync.")
         
-        # Perform the full sync by sending all current data as commands.
-        all_commands = await self.storage.get_all_data_as_commands()
-        logging.info(f"Sending {len(all_commands)} commands to replica {peername} for initial sync.")
-        for command, args in all_commands:
-            writer.write(self.protocol.format_command_as_bytes(command, *args))
+        # Perform the full sync by sending all current data as commands, batched into
+        # large chunks instead of one transport write per command.
+        buf = bytearray()
+        count = 0
+        for command, args in self.storage.get_all_data_as_commands():
+            encode_command_into(buf, command, *args)
+            count += 1
+            if len(buf) >= FULL_SYNC_CHUNK_BYTES:
+                writer.write(bytes(buf))
+                buf.clear()
+        if buf:
+            writer.write(bytes(buf))
+        # Register before the first await, so every write made after the dump is propagated
+        # and queued behind it on the transport.
+        self.slaves.append(writer)
+        logging.info(f"Sent {count} commands to replica {peername} for initial sync.")
         
         await writer.drain()
-        self.slaves.append(writer)
         logging.info(f"Full sync for replica {peername} completed. Now in live propagation mode.")
 
-    async def propagate(self, command: str, *args: Any):
-        """Propagates a write command to all connected replicas."""
-        if not self.slaves:
-            return
-        
-        logging.debug(f"Propagating command to {len(self.slaves)} replicas: {command} {args}")
-        formatted_command = self.protocol.format_command_as_bytes(command, *args)
-        
-        disconnected_slaves = []
+    def propagate(self, frame: bytes):
+        """
+        Queues an already RESP-encoded write command on every connected replica's transport.
+        Nothing is awaited here; flush_slaves() drains them once per batch of commands.
+        Replicas are removed as soon as their connection is lost (see remove_slave), so
+        this loop does not need to check for dead connections.
+        """
         for slave_writer in self.slaves:
-            if slave_writer.is_closing():
-                disconnected_slaves.append(slave_writer)
-                continue
-            try:
-                slave_writer.write(formatted_command)
-                await slave_writer.drain()
-            except ConnectionError:
-                logging.warning(f"Connection error writing to replica: {slave_writer.get_extra_info('peername')}. Removing from list.")
-                disconnected_slaves.append(slave_writer)
-        
-        # Clean up list of replicas that have disconnected.
-        for dw in disconnected_slaves:
-            if dw in self.slaves:
-                self.slaves.remove(dw)
+            slave_writer.write(frame)
+
+    def remove_slave(self, writer: asyncio.StreamWriter):
+        """Stops propagating to a replica whose connection has closed."""
+        self._drop_slaves((writer,))
+
+    def _drop_slaves(self, gone):
+        """Removes replicas in a single pass. The list is filtered in place because client handlers hold a reference to it."""
+        gone = set(gone)
+        self.slaves[:] = [w for w in self.slaves if w not in gone]
+
+    async def flush_slaves(self):
+        """Waits until every replica's transport buffer is below its high-water mark."""
+        slaves = [w for w in self.slaves if not w.is_closing()]
+        results = await asyncio.gather(*(w.drain() for w in slaves), return_exceptions=True)
+        failed = []
+        for slave_writer, result in zip(slaves, results):
+            if isinstance(result, ConnectionError):
+                logging.warning("Connection error writing to replica: %s. Removing from list.", slave_writer.get_extra_info('peername'))
+                failed.append(slave_writer)
+        if failed:
+            self._drop_slaves(failed)
 
     async def connect_to_master(self):
         """Task for a replica to connect to its master and listen for commands."""
         while True:
+            writer = None
             try:
                 logging.info(f"Connecting to master at {self.config.master_host}:{self.config.master_port}")
                 reader, writer = await asyncio.open_connection(self.config.master_host, self.config.master_port)
                 
                 # Identify itself to the master as a replica.
-                writer.write(self.protocol.format_command_as_bytes("REPLICAOF", "listening-port", self.config.port))
+                writer.write(self.protocol.format_command_as_bytes(b"REPLICAOF", b"listening-port", self.config.port))
                 await writer.drain()
                 logging.info("Successfully connected to master, awaiting commands.")
 
-                # In a real RESP parser, this would be a loop that reads and parses streams.
-                # For simplicity, we assume commands arrive as distinct chunks.
-                while True:
-                    data = await reader.read(4096)
+                # The master streams RESP arrays: the full sync followed by live writes, many
+                # per read. Frame them with the same incremental parser used for clients.
+                parser = HiredisStreamParser() if hiredis is not None else RespStreamParser(self.protocol)
+                execute_command = self.storage.execute_command
+                in_sync = True
+                while in_sync:
+                    data = await reader.read(READ_CHUNK_SIZE)
                     if not data:
                         logging.warning("Connection to master lost.")
                         break
                     
-                    try:
-                        # This simple parsing assumes one command per read, which is not robust.
-                        # A proper implementation would use a streaming parser.
-                        command, args = self.protocol.parse_command(data.decode('utf-8'))
-                        # Apply commands from master directly, without taking a lock.
-                        # Replicas do not write to AOF or propagate further.
-                        await self.storage.execute_command(command, args, propagate_func=None)
-                        logging.debug(f"Applied command from master: {command}")
-                    except Exception as e:
-                        logging.error(f"Error processing command from master: {e}")
+                    parser.feed(data)
+                    self.storage.refresh_clock()
+                    while True:
+                        try:
+                            parsed = parser.next_command()
+                        except (CommandError, ValueError) as e:
+                            # The stream can no longer be framed; reconnect for a fresh full sync.
+                            logging.error(f"Protocol error in stream from master: {e}")
+                            in_sync = False
+                            break
+                        if parsed is None:
+                            break
+                        command, args = parsed
+                        try:
+                            # Apply commands from master directly.
+                            # Replicas do not write to AOF or propagate further.
+                            execute_command(command, args, propagate_func=None)
+                        except Exception as e:
+                            logging.error(f"Error processing command from master: {e}")
 
             except ConnectionRefusedError:
                 logging.error("Master refused connection. Retrying in 5 seconds.")
             except Exception as e:
                 logging.error(f"Error connecting to master: {e}. Retrying in 5 seconds.")
             
-            writer.close()
-            await writer.wait_closed()
+            if writer is not None:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except ConnectionError:
+                    pass
             await asyncio.sleep(5)
 
 
 # --- Server and Client Handling ---
 
-async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, storage: StorageEngine, protocol: ProtocolHandler, repl_manager: ReplicationManager):
+async def _read_reply_frame(reader: asyncio.StreamReader) -> bytes:
+    """Reads one complete RESP reply from `reader` and returns it still encoded."""
+    line = await reader.readuntil(b"\r\n")
+    prefix = line[:1]
+    if prefix == b"$":
+        length = int(line[1:-2])
+        if length >= 0:
+            return line + await reader.readexactly(length + 2)
+    elif prefix == b"*":
+        parts = [line]
+        for _ in range(int(line[1:-2])):
+            parts.append(await _read_reply_frame(reader))
+        return b"".join(parts)
+    return line
+
+
+class WorkerLink:
+    """
+    A persistent connection from one worker to another worker's own port, used to forward
+    commands for keys that worker owns. Any number of clients may forward through it at
+    once: replies come back in request order, so each request just waits its turn in a FIFO.
+    """
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Deque[asyncio.Future] = deque()
+        self._connect_lock = asyncio.Lock()
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        async with self._connect_lock:
+            if self._writer is None:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                self._writer = writer
+                self._reader_task = asyncio.create_task(self._read_replies(reader, writer))
+            return self._writer
+
+    async def _read_replies(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        error: Exception = ConnectionError("connection closed")
+        try:
+            while True:
+                reply = await _read_reply_frame(reader)
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_result(reply)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError) as e:
+            error = e
+        finally:
+            # Requests still waiting lose their link; the next request reconnects.
+            if self._writer is writer:
+                self._writer = None
+            writer.close()
+            pending, self._pending = self._pending, deque()
+            for future in pending:
+                if not future.done():
+                    future.set_exception(ConnectionError(f"worker link closed: {error}"))
+
+    async def request(self, frame: bytes) -> bytes:
+        """Sends one RESP-encoded command and returns its reply, still encoded."""
+        writer = self._writer or await self._connect()
+        future = asyncio.get_running_loop().create_future()
+        # write() and append() happen together, so the FIFO order matches the wire order.
+        writer.write(frame)
+        self._pending.append(future)
+        try:
+            await writer.drain()
+        except BaseException:
+            future.cancel()  # The reply, if any, is dropped by _read_replies.
+            raise
+        return await future
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+
+
+class ShardMap:
+    """
+    Assigns keys to workers when the server runs with --workers N.
+    Every worker accepts on the shared port (SO_REUSEPORT), so a connection lands on an
+    arbitrary worker; worker i also listens alone on worker_port_base + i. A command for a
+    key owned by another worker is forwarded to that worker's port and its reply relayed
+    back, so plain clients work against the shared port. Inside MULTI the client gets a
+    MOVED reply instead, because a transaction has to run on a single shard.
+    """
+    def __init__(self, worker_id: int, workers: int, host: str, worker_port_base: int):
+        self.worker_id = worker_id
+        self.workers = workers
+        self.host = host
+        self.worker_port_base = worker_port_base
+        self._links: Dict[int, WorkerLink] = {}
+
+    def worker_port(self, worker_id: int) -> int:
+        return self.worker_port_base + worker_id
+
+    def owner(self, key: bytes) -> int:
+        # crc32 rather than hash(): bytes hashing is randomized per process, and the shard
+        # files on disk must map to the same workers across restarts.
+        return zlib.crc32(key) % self.workers
+
+    def moved(self, owner: int) -> MovedError:
+        return MovedError(f"MOVED {owner} {self.host}:{self.worker_port(owner)}")
+
+    def check(self, key: bytes):
+        """Raises MovedError unless this worker owns `key`."""
+        owner = self.owner(key)
+        if owner != self.worker_id:
+            raise self.moved(owner)
+
+    async def forward(self, owner: int, command: bytes, args: List[bytes]) -> bytes:
+        """Runs a command on the worker that owns its key and returns the encoded reply."""
+        link = self._links.get(owner)
+        if link is None:
+            link = self._links[owner] = WorkerLink(self.host, self.worker_port(owner))
+        try:
+            return await link.request(encode_command(command, *args))
+        except (OSError, ConnectionError) as e:
+            raise CommandError(f"worker {owner} is unreachable: {e}") from None
+
+    async def close(self):
+        for link in self._links.values():
+            await link.close()
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, storage: StorageEngine, protocol: ProtocolHandler, repl_manager: ReplicationManager, shard_map: Optional[ShardMap] = None):
     """Main coroutine to handle a single client connection."""
     addr = writer.get_extra_info('peername')
-    logging.info(f"New connection from {addr} (Role: {repl_manager.role})")
+    logging.info("New connection from %s (Role: %s)", addr, repl_manager.role)
     
     in_transaction = False
     command_queue = []
+    # Set when a command could not be queued (MOVED), so the whole transaction is refused.
+    transaction_aborted = False
+    # Replies are encoded straight into this buffer and flushed once per pipelined batch.
+    out = bytearray()
+
+    # Localize lookups for hot loop. The parser is chosen once the first bytes arrive.
+    parser = None
+    format_response = protocol.format_response
+    execute_command = storage.execute_command
+    command_runners = storage.command_runners
+    refresh_clock = storage.refresh_clock
+    propagate = repl_manager.propagate
+    slaves = repl_manager.slaves
+    is_slave = repl_manager.role == 'slave'
+    command_names = COMMAND_NAMES
 
     try:
         while True:
-            data = await reader.read(1024)
-            if not data:
-                break 
+            data = await reader.read(READ_CHUNK_SIZE)
+            eof = not data
+            if parser is None:
+                parser = make_stream_parser(protocol, data)
+                feed = parser.feed
+                next_command = parser.next_command
+            feed(data)
+            # Every command in this batch sees the same clock reading.
+            refresh_clock()
 
-            command_raw = data.decode('utf-8')
-            response = ""
+            while True:
+                try:
+                    parsed = next_command(eof)
+                except (CommandError, ValueError) as e:
+                    # A malformed frame leaves the stream unsynchronized; like Redis, report it and hang up.
+                    format_response(CommandError(f"Protocol error: {e}"), out)
+                    writer.write(bytes(out))
+                    return
+                if parsed is None:
+                    break
+                command, args = parsed
+                command = command_names.get(command) or command.upper()
 
-            try:
-                command, args = protocol.parse_command(command_raw)
-
-                # --- Replication-specific Commands ---
-                if command == 'REPLICAOF' and repl_manager.role == 'master':
-                    # This connection is now a replica. Hand it off to the replication manager.
-                    # It will no longer be treated as a regular client.
-                    await repl_manager.add_slave(writer)
-                    await writer.wait_closed() # Keep connection open for master-to-slave propagation.
-                    break 
-
-                # --- Write Command Blocking on Replicas ---
-                is_write_command = command in ["SET", "DELETE", "EXPIRE", "LPUSH", "HSET", "MULTI"]
-                if repl_manager.role == 'slave' and is_write_command:
-                    raise CommandError("READONLY You can't write against a read-only replica.")
-
-                # --- Transaction Commands ---
-                if command == 'MULTI':
-                    if in_transaction: raise CommandError("MULTI calls cannot be nested")
-                    in_transaction = True
-                    command_queue = []
-                    response = protocol.format_response("OK")
-                
-                elif command == 'DISCARD':
-                    if not in_transaction: raise CommandError("DISCARD without MULTI")
-                    in_transaction = False
-                    command_queue = []
-                    response = protocol.format_response("OK")
-
-                elif command == 'EXEC':
-                    if not in_transaction: raise CommandError("EXEC without MULTI")
-                    results = await storage.execute_transaction(command_queue, propagate_func=repl_manager.propagate)
-                    in_transaction = False
-                    command_queue = []
-                    response = protocol.format_response(results)
-
-                elif in_transaction:
-                    command_queue.append((command, args))
-                    response = protocol.format_response("QUEUED")
-                
-                else: # --- Standard Command Execution ---
-                    result = await storage.execute_command(command, args, propagate_func=repl_manager.propagate)
-                    response = protocol.format_response(result)
+                try:
 
-            except (CommandError, WrongTypeError, ValueError) as e:
-                response = protocol.format_response(e)
-            except Exception as e:
-                logging.error(f"Unexpected error while handling client ({addr}): {e}")
-                response = protocol.format_response(CommandError("Server error"))
+                    # --- Replication-specific Commands ---
+                    if command == b'REPLICAOF' and repl_manager.role == 'master':
+                        if shard_map is not None:
+                            raise CommandError("REPLICAOF is not supported with --workers")
+                        # This connection is now a replica. Hand it off to the replication manager.
+                        # It will no longer be treated as a regular client.
+                        if out:
+                            writer.write(bytes(out))
+                            out.clear()
+                        try:
+                            await repl_manager.add_slave(writer)
+                            await writer.wait_closed() # Keep connection open for master-to-slave propagation.
+                        except ConnectionError:
+                            pass  # A replica going away shows up here as the error that closed it.
+                        finally:
+                            repl_manager.remove_slave(writer)
+                        return
 
-            writer.write(response.encode('utf-8'))
-            await writer.drain()
+                    # --- Write Command Blocking on Replicas ---
+                    if is_slave and (command in WRITE_COMMANDS or command == b'MULTI'):
+                        raise CommandError("READONLY You can't write against a read-only replica.")
+
+                    # --- Key Routing with --workers ---
+                    # Keys owned by another worker are forwarded to it. Inside MULTI the client
+                    # gets MOVED and the transaction is refused, so it never spans two shards.
+                    owner = None
+                    if shard_map is not None and args and command in COMMAND_ARITY:
+                        owner = shard_map.owner(args[0])
+                        if owner == shard_map.worker_id:
+                            owner = None
+                        elif in_transaction:
+                            transaction_aborted = True
+                            raise shard_map.moved(owner)
+
+                    if owner is not None:
+                        out += await shard_map.forward(owner, command, args)
+                        # Other clients may have run while this one waited.
+                        refresh_clock()
+
+                    # --- Transaction Commands ---
+                    elif command == b'MULTI':
+                        if in_transaction: raise CommandError("MULTI calls cannot be nested")
+                        in_transaction = True
+                        transaction_aborted = False
+                        command_queue = []
+                        out += RESP_OK
+                    
+                    elif command == b'DISCARD':
+                        if not in_transaction: raise CommandError("DISCARD without MULTI")
+                        in_transaction = False
+                        command_queue = []
+                        out += RESP_OK
+
+                    elif command == b'EXEC':
+                        if not in_transaction: raise CommandError("EXEC without MULTI")
+                        # EXEC always ends the transaction, even if one of its commands fails.
+                        queued, command_queue = command_queue, []
+                        in_transaction = False
+                        if transaction_aborted:
+                            raise CommandError("EXECABORT Transaction discarded because of previous errors.")
+                        results = storage.execute_transaction(queued, propagate_func=propagate if slaves else None)
+                        format_response(results, out)
+
+                    elif in_transaction:
+                        command_queue.append((command, args))
+                        out += RESP_QUEUED
+                    
+                    else: # --- Standard Command Execution ---
+                        # Without replicas there is nothing to propagate, so skip encoding the frame.
+                        run = command_runners.get(command)
+                        if run is not None:
+                            result = run(args, propagate if slaves else None)
+                        else:
+                            # Unknown command: execute_command raises the error reply.
+                            result = execute_command(command, args, propagate_func=propagate if slaves else None)
+                        format_response(result, out)
+
+                except (CommandError, WrongTypeError, ValueError) as e:
+                    format_response(e, out)
+                except Exception as e:
+                    logging.error(f"Unexpected error while handling client ({addr}): {e}")
+                    format_response(CommandError("Server error"), out)
+
+                if len(out) >= MAX_PIPELINE_BYTES:
+                    writer.write(bytes(out))
+                    out.clear()
+                    await writer.drain()
+                    # Other clients may have run while this one waited.
+                    refresh_clock()
+
+            # Every command that arrived with this read has been answered:
+            # a pipeline of N commands becomes one write() and a single drain.
+            if out:
+                writer.write(bytes(out))
+                out.clear()
+                await writer.drain()
+            # Writes from this batch were queued on the replicas without waiting; drain them once.
+            if slaves:
+                await repl_manager.flush_slaves()
+            if eof:
+                return
 
     except ConnectionResetError:
-        logging.warning(f"Connection reset by peer: {addr}")
+        logging.warning("Connection reset by peer: %s", addr)
     finally:
-        logging.info(f"Connection closed for {addr}")
+        logging.info("Connection closed for %s", addr)
         writer.close()
-        await writer.wait_closed()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
 
 
 async def periodic_snapshot(storage: StorageEngine, interval: int):
@@ -488,16 +1448,31 @@ async def periodic_snapshot(storage: StorageEngine, interval: int):
         await storage.save_snapshot()
 
 
-async def main(args):
-    """The main entry point for the IgnisDB server."""
+def _shard_path(path: str, worker_id: int) -> str:
+    """Per-worker file name, keeping the extension: dump.msgpack -> dump.2.msgpack."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{worker_id}{ext}"
+
+
+async def main(args, worker_id: Optional[int] = None):
+    """
+    The main entry point for the IgnisDB server.
+    With worker_id set, this process is one of args.workers shards (see run_workers).
+    """
     host = '127.0.0.1'
-    args.port = args.port if args.port else (6380 if args.role == 'master' else 6381)
+    args.port = args.port if args.port else (DEFAULT_MASTER_PORT if args.role == 'master' else DEFAULT_SLAVE_PORT)
+
+    shard_map = None
+    aof_file, snapshot_file = args.aof_file, args.snapshot_file
+    if worker_id is not None:
+        shard_map = ShardMap(worker_id, args.workers, host, args.worker_port_base)
+        aof_file, snapshot_file = _shard_path(aof_file, worker_id), _shard_path(snapshot_file, worker_id)
 
     # Initialize persistence, storage, protocol, and replication handlers
-    aof_handler = AofHandler(args.aof_file) if args.persistence_mode == 'aof' else None
+    aof_handler = AofHandler(aof_file) if args.persistence_mode == 'aof' else None
     if aof_handler: aof_handler.open()
     
-    storage = StorageEngine(snapshot_path=args.snapshot_file, aof_handler=aof_handler)
+    storage = StorageEngine(snapshot_path=snapshot_file, aof_handler=aof_handler)
     protocol = ProtocolHandler()
     repl_manager = ReplicationManager(args.role, storage, protocol, args)
 
@@ -511,24 +1486,81 @@ async def main(args):
     if args.persistence_mode == 'snapshot' and args.role == 'master':
         asyncio.create_task(periodic_snapshot(storage, args.snapshot_interval))
     
+    asyncio.create_task(storage.run_active_expiration())
+
     if args.role == 'slave':
         asyncio.create_task(repl_manager.connect_to_master())
     
     # Start the main TCP server
-    server = await asyncio.start_server(
-        lambda r, w: handle_client(r, w, storage, protocol, repl_manager),
-        host,
-        args.port
-    )
-
-    logging.info(f'IgnisDB server running on {host}:{args.port} | Role: {args.role.upper()} | Persistence: {args.persistence_mode}')
+    client_handler = lambda r, w: handle_client(r, w, storage, protocol, repl_manager, shard_map)
+    own_server = None
+    if shard_map is None:
+        server = await asyncio.start_server(client_handler, host, args.port)
+        logging.info(f'IgnisDB server running on {host}:{args.port} | Role: {args.role.upper()} | Persistence: {args.persistence_mode}')
+    else:
+        # All workers share the main port; the kernel spreads connections across them.
+        server = await asyncio.start_server(client_handler, host, args.port, reuse_port=True)
+        own_port = shard_map.worker_port(worker_id)
+        # start_server() is already accepting; the main server's loop below keeps it alive.
+        own_server = await asyncio.start_server(client_handler, host, own_port)
+        logging.info(f'IgnisDB worker {worker_id}/{args.workers} running on {host}:{args.port} and {host}:{own_port} | Persistence: {args.persistence_mode}')
 
     try:
         async with server:
             await server.serve_forever()
     finally:
+        if own_server:
+            own_server.close()
+        if shard_map:
+            await shard_map.close()
         if aof_handler:
-            aof_handler.close()
+            await aof_handler.close()
+
+
+def run_workers(args):
+    """
+    Forks args.workers server processes, each owning one shard of the keyspace with its
+    own storage, AOF and snapshot files, and waits for them. Every worker runs its own
+    event loop, so commands are served on as many cores as there are workers.
+    """
+    children = set()
+    for worker_id in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            # Workers get their own process group so a terminal Ctrl+C reaches only the
+            # parent, which passes a single SIGINT on. SIGINT is restored to raise
+            # KeyboardInterrupt even if the parent was started with it ignored, so each
+            # worker shuts down like the single-process server and closes its AOF.
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            status = 0
+            try:
+                asyncio.run(main(args, worker_id))
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                logging.exception(f"Worker {worker_id} crashed")
+                status = 1
+            finally:
+                os._exit(status)
+        children.add(pid)
+
+    def stop_workers(signum=None, frame=None):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGINT)
+            except ProcessLookupError:
+                pass
+
+    # Stopping the parent (SIGTERM or Ctrl+C) shuts the workers down instead of orphaning them.
+    signal.signal(signal.SIGTERM, stop_workers)
+    while children:
+        try:
+            pid, _ = os.wait()
+            children.discard(pid)
+        except KeyboardInterrupt:
+            stop_workers()
 
 
 if __name__ == "__main__":
@@ -536,19 +1568,49 @@ if __name__ == "__main__":
     
     # Server Role and Networking
     parser.add_argument('--role', type=str, choices=['master', 'slave'], default='master', help="The role of this server instance.")
-    parser.add_argument('--port', type=int, help="Port to listen on. Defaults to 6380 for master, 6381 for slave.")
+    parser.add_argument('--port', type=int, help=f"Port to listen on. Defaults to {DEFAULT_MASTER_PORT} for master, {DEFAULT_SLAVE_PORT} for slave.")
     parser.add_argument('--master-host', type=str, default='127.0.0.1', help="Hostname of the master (used by slaves).")
     parser.add_argument('--master-port', type=int, default=6380, help="Port of the master (used by slaves).")
     
     # Persistence
     parser.add_argument('--persistence-mode', type=str, choices=['snapshot', 'aof'], default='snapshot', help="The persistence mode.")
-    parser.add_argument('--snapshot-file', type=str, default='ignisdb_snapshot.json', help="Path for the snapshot file.")
+    parser.add_argument('--snapshot-file', type=str, default=DEFAULT_SNAPSHOT_FILE, help="Path for the snapshot file ('.msgpack' for MessagePack, otherwise JSON). Not shared with main.py, whose snapshots are JSON.")
     parser.add_argument('--aof-file', type=str, default='ignisdb.aof', help="Path for the Append-Only File.")
     parser.add_argument('--snapshot-interval', type=int, default=300, help="Interval in seconds for periodic snapshotting.")
+
+    # Sharding
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes, each owning a shard of the keys. Worker i also listens on --worker-port-base + i; commands for keys owned by another worker are forwarded to it. Inside MULTI such keys get a MOVED reply, since a transaction cannot span shards.")
+    parser.add_argument('--worker-port-base', type=int, help=f"First per-worker port used with --workers. Defaults to port + {WORKER_PORT_OFFSET}.")
     
     cli_args = parser.parse_args()
+    if cli_args.workers > 1:
+        if cli_args.role != 'master':
+            parser.error("--workers requires --role master")
+        if not hasattr(os, 'fork') or not hasattr(socket, 'SO_REUSEPORT'):
+            parser.error("--workers needs fork() and SO_REUSEPORT")
+        port = cli_args.port or DEFAULT_MASTER_PORT
+        if cli_args.worker_port_base is None:
+            cli_args.worker_port_base = port + WORKER_PORT_OFFSET
+        worker_ports = range(cli_args.worker_port_base, cli_args.worker_port_base + cli_args.workers)
+        if worker_ports.start < 1 or worker_ports.stop > 65536:
+            parser.error(f"worker ports {worker_ports.start}-{worker_ports.stop - 1} are out of range")
+        # A replica started with the defaults listens on DEFAULT_SLAVE_PORT.
+        for reserved in (port, DEFAULT_SLAVE_PORT):
+            if reserved in worker_ports:
+                parser.error(f"worker ports {worker_ports.start}-{worker_ports.stop - 1} overlap port {reserved}; choose another --worker-port-base")
+
+    # uvloop is an optional, faster drop-in event loop (not available on Windows).
+    try:
+        import uvloop
+        uvloop.install()
+        logging.info("Using uvloop event loop.")
+    except ImportError:
+        pass
     
     try:
-        asyncio.run(main(cli_args))
+        if cli_args.workers > 1:
+            run_workers(cli_args)
+        else:
+            asyncio.run(main(cli_args))
     except KeyboardInterrupt:
         logging.info("Shutting down server...")
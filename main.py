@@ -45,6 +45,7 @@ def parse_args():
         'host': '127.0.0.1',
         'port': 6381,
         'mode': 'snapshot',
+        # JSON, unlike ignisdb_server.py's '.msgpack' default: SnapshotHandler only writes JSON.
         'snapshot_file': 'ignisdb_snapshot.json',
         'aof_file': 'ignisdb.aof',
         'snapshot_interval': 300,
@@ -101,9 +102,10 @@ async def main():
     
     try:
         await server.start()
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # asyncio.run() delivers Ctrl+C to this task as a cancellation on Python 3.11+.
         logging.info("Shutting down...")
-        server.shutdown()
+        await server.shutdown()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,200 @@
+"""AOF write, flush, rewrite and replay for the package server (ignisdb/)."""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from ignisdb import persistence
+from ignisdb.persistence import AofHandler, AOF_FLUSH_BYTES
+from ignisdb.server import IgnisServer
+
+_flush_to_disk = persistence._flush_to_disk
+
+
+def slow_flush_to_disk(fd, batch):
+    """Stands in for persistence._flush_to_disk with a flush that takes a while."""
+    time.sleep(0.05)
+    _flush_to_disk(fd, batch)
+
+
+class AofHandlerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'ignisdb.aof')
+        self.aof = AofHandler(self.path)
+        self.aof.open()
+
+    async def asyncTearDown(self):
+        await self.aof.close()
+        self.tmpdir.cleanup()
+
+    async def reopen_and_load(self):
+        await self.aof.close()
+        return AofHandler(self.path).load()
+
+    async def test_write_close_load(self):
+        self.aof.write('SET', 'k', 'v')
+        self.aof.write('HSET', 'h', 'title', 'çay')
+        self.aof.write('LPUSH', 'l', 1, 2)
+
+        commands = await self.reopen_and_load()
+        self.assertEqual(commands, [
+            ('SET', ['k', 'v']),
+            ('HSET', ['h', 'title', 'çay']),
+            ('LPUSH', ['l', '1', '2']),
+        ])
+
+    async def test_close_waits_for_flush_in_flight(self):
+        with mock.patch.object(persistence, '_flush_to_disk', slow_flush_to_disk):
+            self.aof.write('SET', 'a', '1')
+            flush = asyncio.create_task(self.aof.fsync())
+            await asyncio.sleep(0)
+            self.assertIsNotNone(self.aof._flush_future)
+
+            self.aof.write('SET', 'b', '2')
+            await self.aof.close()
+            await flush
+
+        commands = AofHandler(self.path).load()
+        self.assertEqual(commands, [('SET', ['a', '1']), ('SET', ['b', '2'])])
+
+    async def test_wait_for_flush_returns_once_flush_is_done(self):
+        with mock.patch.object(persistence, '_flush_to_disk', slow_flush_to_disk):
+            self.aof.write('SET', 'a', '1')
+            flush = asyncio.create_task(self.aof.fsync())
+            await asyncio.sleep(0)
+            future = self.aof._flush_future
+            await asyncio.wait([future])
+            # The done callback clears the field before the flushing task resumes.
+            self.assertIsNone(self.aof._flush_future)
+            await flush
+
+        # A waiter that finds a finished flush still recorded returns instead of spinning.
+        done = asyncio.get_running_loop().create_future()
+        done.set_result(None)
+        self.aof._flush_future = done
+        await asyncio.wait_for(self.aof._wait_for_flush(), timeout=1)
+
+    async def test_one_pending_flush_while_in_flight(self):
+        value = 'x' * AOF_FLUSH_BYTES
+        with mock.patch.object(persistence, '_flush_to_disk', slow_flush_to_disk):
+            self.aof.write('SET', 'first', value)
+            early_flush = self.aof._early_flush
+            await asyncio.sleep(0)
+            self.assertIsNotNone(self.aof._flush_future)
+
+            tasks = len(asyncio.all_tasks())
+            for i in range(10):
+                self.aof.write('SET', f'k{i}', value)
+            self.assertEqual(len(asyncio.all_tasks()), tasks)
+            self.assertIs(self.aof._early_flush, early_flush)
+
+            # The flush in flight drains the batches written meanwhile.
+            await early_flush
+            self.assertFalse(self.aof._buffer)
+
+        commands = await self.reopen_and_load()
+        self.assertEqual([args[0] for _, args in commands], ['first'] + [f'k{i}' for i in range(10)])
+
+    async def test_rewrite_keeps_later_writes(self):
+        self.aof.write('SET', 'old', '1')
+        self.aof.write('SET', 'old', '2')
+        await self.aof.fsync()
+
+        data = {'old': ('string', '2', None), 'h': ('hash', {'f': 'v'}, None)}
+        with mock.patch.object(persistence, '_flush_to_disk', slow_flush_to_disk):
+            self.aof.write('SET', 'pending', '1')
+            flush = asyncio.create_task(self.aof.fsync())
+            await asyncio.sleep(0)
+            self.assertTrue(await self.aof.rewrite(data))
+            await flush
+
+        self.aof.write('SET', 'new', '3')
+        commands = await self.reopen_and_load()
+        self.assertEqual(commands, [
+            ('SET', ['old', '2']),
+            ('HSET', ['h', 'f', 'v']),
+            ('SET', ['new', '3']),
+        ])
+
+    async def test_rewrite_uses_byte_lengths(self):
+        data = {'k': ('string', 'çay', None), 'h': ('hash', {'title': 'Süt al'}, None)}
+        self.assertTrue(await self.aof.rewrite(data))
+        self.aof.write('SET', 'new', 'ğ')
+        await self.aof.close()
+
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        self.assertEqual(content, b''.join([
+            b'*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$4\r\n' + 'çay'.encode('utf-8') + b'\r\n',
+            b'*4\r\n$4\r\nHSET\r\n$1\r\nh\r\n$5\r\ntitle\r\n$7\r\n' + 'Süt al'.encode('utf-8') + b'\r\n',
+            b'*3\r\n$3\r\nSET\r\n$3\r\nnew\r\n$2\r\n' + 'ğ'.encode('utf-8') + b'\r\n',
+        ]))
+        self.assertEqual(AofHandler(self.path).load(), [
+            ('SET', ['k', 'çay']),
+            ('HSET', ['h', 'title', 'Süt al']),
+            ('SET', ['new', 'ğ']),
+        ])
+
+
+class AofReplayTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_server(self):
+        return IgnisServer(
+            host='127.0.0.1', port=0, persistence_mode='aof',
+            snapshot_path=os.path.join(self.tmpdir.name, 'snapshot.json'),
+            aof_path=os.path.join(self.tmpdir.name, 'ignisdb.aof'),
+            snapshot_interval=0,
+        )
+
+    async def test_replay_after_shutdown(self):
+        server = self.make_server()
+        await server.initialize()
+        handlers = []
+
+        async def track(reader, writer):
+            handlers.append(asyncio.current_task())
+            await server.handle_client(reader, writer)
+
+        listener = await asyncio.start_server(track, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        commands = [
+            (b'SET', b'k', b'v'),
+            (b'HSET', b'task:1', b'title', b'Milk'),
+            (b'LPUSH', b'tasks', b'a', b'b'),
+            (b'SADD', b's', b'x'),
+            (b'SET', b'gone', b'1'),
+            (b'DELETE', b'gone'),
+        ]
+        for command in commands:
+            frame = b'*%d\r\n' % len(command) + b''.join(b'$%d\r\n%s\r\n' % (len(a), a) for a in command)
+            writer.write(frame)
+            await writer.drain()
+            await reader.readline()
+        writer.close()
+        await writer.wait_closed()
+        await asyncio.gather(*handlers)
+        listener.close()
+        await listener.wait_closed()
+        await server.shutdown()
+
+        replayed = self.make_server()
+        await replayed.initialize()
+        await replayed.shutdown()
+        storage = replayed.storage
+        self.assertEqual(storage.get('k'), 'v')
+        self.assertEqual(storage.hget('task:1', 'title'), 'Milk')
+        self.assertEqual(storage.lrange('tasks', 0, -1), ['b', 'a'])
+        self.assertIsNone(storage.get('gone'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+"""RESP and inline command parsing."""
+import unittest
+
+import ignisdb_server
+from ignisdb_server import CommandError, ProtocolHandler, RespStreamParser, encode_command
+from ignisdb import protocol as package_protocol
+from ignisdb.protocol import ProtocolHandler as PackageProtocolHandler
+
+
+class RespStreamParserTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = RespStreamParser(ProtocolHandler())
+
+    def commands(self, data, eof=False):
+        self.parser.feed(data)
+        parsed = []
+        while True:
+            command = self.parser.next_command(eof)
+            if command is None:
+                return parsed
+            parsed.append(command)
+
+    def test_resp_array(self):
+        self.assertEqual(self.commands(encode_command(b'SET', b'k', b'v')), [(b'SET', [b'k', b'v'])])
+
+    def test_binary_safe_bulk_strings(self):
+        frame = encode_command(b'SET', b'k', b'a\r\nb c\x00')
+        self.assertEqual(self.commands(frame), [(b'SET', [b'k', b'a\r\nb c\x00'])])
+
+    def test_pipelined_commands(self):
+        data = encode_command(b'SET', b'k', b'v') + encode_command(b'GET', b'k') + b'GET k\r\n'
+        self.assertEqual(self.commands(data), [
+            (b'SET', [b'k', b'v']),
+            (b'GET', [b'k']),
+            (b'GET', [b'k']),
+        ])
+
+    def test_command_split_across_reads(self):
+        frame = encode_command(b'HSET', b'task:1', b'title', b'x' * 20000)
+        head, last = frame[:-1], frame[-1:]
+        for i in range(0, len(head), 4096):
+            self.assertEqual(self.commands(head[i:i + 4096]), [])
+        self.assertEqual(self.commands(last), [(b'HSET', [b'task:1', b'title', b'x' * 20000])])
+
+    def test_partial_command_completes(self):
+        frame = encode_command(b'GET', b'key')
+        self.assertEqual(self.commands(frame[:-1]), [])
+        self.assertEqual(self.commands(frame[-1:]), [(b'GET', [b'key'])])
+
+    def test_missing_crlf_after_bulk(self):
+        with self.assertRaisesRegex(CommandError, "CRLF"):
+            self.commands(b'*2\r\n$3\r\nGET\r\n$1\r\nkXX')
+
+    def test_negative_bulk_length(self):
+        for length in (b'-1', b'-2'):
+            parser = RespStreamParser(ProtocolHandler())
+            parser.feed(b'*2\r\n$3\r\nGET\r\n$' + length + b'\r\nkey\r\n')
+            with self.assertRaisesRegex(CommandError, "invalid bulk length"):
+                parser.next_command()
+
+    def test_negative_array_length(self):
+        with self.assertRaisesRegex(CommandError, "invalid multibulk length"):
+            self.commands(b'*-2\r\n')
+
+    def test_empty_array(self):
+        with self.assertRaisesRegex(CommandError, "Empty command"):
+            self.commands(b'*0\r\n')
+
+    def test_inline_commands(self):
+        self.assertEqual(self.commands(b'GET k\r\n\r\nLRANGE l 0 -1\n'), [
+            (b'GET', [b'k']),
+            (b'LRANGE', [b'l', b'0', b'-1']),
+        ])
+
+    def test_inline_last_value_keeps_spaces(self):
+        self.assertEqual(self.commands(b'HSET task:1 title Buy some milk\r\n'),
+                         [(b'HSET', [b'task:1', b'title', b'Buy some milk'])])
+
+    def test_inline_set_value_keeps_spaces(self):
+        self.assertEqual(self.commands(b'SET k hello world\r\nset k v with spaces\r\nSET k v\r\n'), [
+            (b'SET', [b'k', b'hello world']),
+            (b'set', [b'k', b'v with spaces']),
+            (b'SET', [b'k', b'v']),
+        ])
+
+    def test_inline_set_trailing_integer_is_the_ttl(self):
+        self.assertEqual(self.commands(b'SET k v 100\r\nSET k Buy some milk 60\r\nSET k 100\r\n'), [
+            (b'SET', [b'k', b'v', b'100']),
+            (b'SET', [b'k', b'Buy some milk', b'60']),
+            (b'SET', [b'k', b'100']),
+        ])
+
+    def test_inline_at_eof_without_newline(self):
+        self.assertEqual(self.commands(b'GET k', eof=True), [(b'GET', [b'k'])])
+
+    def test_inline_too_big(self):
+        with self.assertRaisesRegex(CommandError, "too big"):
+            self.commands(b'GET ' + b'x' * (ignisdb_server.INLINE_MAX_SIZE + 1))
+
+
+class CommandArgumentTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = ignisdb_server.StorageEngine('unused.json', aof_handler=None)
+        self.parser = RespStreamParser(ProtocolHandler())
+
+    def run_frame(self, frame):
+        self.parser.feed(frame)
+        command, args = self.parser.next_command()
+        return self.storage.execute_command(command, args)
+
+    def test_inline_set_with_spaces(self):
+        self.assertEqual(self.run_frame(b'SET k hello world\r\n'), 'OK')
+        self.assertEqual(self.storage.execute_command(b'GET', [b'k']), b'hello world')
+        self.run_frame(b'SET t v with spaces 100\r\n')
+        self.assertEqual(self.storage.execute_command(b'GET', [b't']), b'v with spaces')
+        self.assertIn(b't', self.storage._expiry)
+
+    def test_non_integer_arguments(self):
+        self.run_frame(b'LPUSH l a\r\n')
+        frames = (encode_command(b'SET', b'k', b'v', b'soon'), b'EXPIRE l later\r\n', b'LRANGE l 0 end\r\n')
+        for frame in frames:
+            with self.subTest(frame=frame), self.assertRaisesRegex(CommandError, "not an integer"):
+                self.run_frame(frame)
+
+    def test_error_reply(self):
+        out = bytearray()
+        try:
+            self.run_frame(b'LRANGE l 0 end\r\n')
+        except CommandError as e:
+            ProtocolHandler().format_response(e, out)
+        self.assertEqual(bytes(out), b'-ERR value is not an integer or out of range\r\n')
+
+
+class ParseCommandTest(unittest.TestCase):
+    def test_standalone_resp_frame(self):
+        protocol = ProtocolHandler()
+        self.assertEqual(protocol.parse_command(encode_command(b'GET', b'k')), (b'GET', [b'k']))
+        with self.assertRaisesRegex(CommandError, "CRLF"):
+            protocol.parse_command(b'*2\r\n$3\r\nGET\r\n$1\r\nkXX')
+        with self.assertRaisesRegex(CommandError, "invalid bulk length"):
+            protocol.parse_command(b'*2\r\n$3\r\nGET\r\n$-5\r\nk\r\n')
+
+    def test_package_resp_and_inline(self):
+        protocol = PackageProtocolHandler()
+        frame = encode_command(b'HSET', b'h', b'f', b'a b')
+        self.assertEqual(protocol.extract_frame(frame + b'GET h\r\n'), (frame, b'GET h\r\n'))
+        self.assertEqual(protocol.parse_command(frame), ('HSET', ['h', 'f', 'a b']))
+        self.assertEqual(protocol.parse_command(b'GET k\r\n'), ('GET', ['k']))
+        self.assertEqual(protocol.extract_frame(frame[:-3]), (None, frame[:-3]))
+
+    def test_package_resp_args_are_utf8(self):
+        protocol = PackageProtocolHandler()
+        frame = encode_command(b'SET', b'k', 'Çay'.encode('utf-8'))
+        self.assertEqual(protocol.parse_command(frame), ('SET', ['k', 'Çay']))
+        self.assertEqual(protocol.parse_command(encode_command(b'SET', b'k', b'\xff')), ('SET', ['k', '\xff']))
+
+    def test_bulk_header_tables_match(self):
+        self.assertEqual(package_protocol.BULK_HEADER_MAX, ignisdb_server.BULK_HEADER_MAX)
+        self.assertEqual(package_protocol.RESP_BULK_HEADERS, ignisdb_server.RESP_BULK_HEADERS)
+        for n in (0, 4096, 4097, 70000):
+            self.assertEqual(package_protocol.bulk_header(n), b'$%d\r\n' % n)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Write propagation from a package server (ignisdb/) master to a replica."""
+import asyncio
+import os
+import tempfile
+import unittest
+
+from ignisdb.protocol import encode_command_into
+from ignisdb.server import IgnisServer
+
+
+def encode(*parts):
+    frame = bytearray()
+    encode_command_into(frame, *parts)
+    return bytes(frame)
+
+
+class PackageReplicationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.master = self.make_server('master')
+        await self.master.initialize()
+        self.handlers = []
+
+        async def track(reader, writer):
+            self.handlers.append(asyncio.current_task())
+            await self.master.handle_client(reader, writer)
+
+        self.listener = await asyncio.start_server(track, '127.0.0.1', 0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        for replica in list(self.master.replicas):
+            replica.close()
+        await asyncio.gather(*self.handlers)
+        self.listener.close()
+        await self.listener.wait_closed()
+        await self.master.shutdown()
+        self.tmpdir.cleanup()
+
+    def make_server(self, name):
+        return IgnisServer(
+            host='127.0.0.1', port=0, persistence_mode='aof',
+            snapshot_path=os.path.join(self.tmpdir.name, f'{name}.json'),
+            aof_path=os.path.join(self.tmpdir.name, f'{name}.aof'),
+            snapshot_interval=0,
+        )
+
+    async def wait_for(self, condition):
+        for _ in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("replica did not catch up")
+
+    async def test_writes_reach_replica_and_aof(self):
+        replica = self.make_server('replica')
+        await replica.initialize()
+        sync = asyncio.create_task(replica.connect_to_master('127.0.0.1', self.port))
+        await self.wait_for(lambda: self.master.replicas)
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        commands = [
+            encode('SET', 'k', ' Buy some milk '),
+            encode('HSET', 'task:1', 'title', 'two\r\nlines'),
+            encode('LPUSH', 'tasks', 'a', 'b'),
+        ]
+        for frame in commands:
+            writer.write(frame)
+            await writer.drain()
+            await reader.readline()
+        writer.close()
+        await writer.wait_closed()
+
+        storage = replica.storage
+        await self.wait_for(lambda: storage.lrange('tasks', 0, -1))
+        self.assertEqual(storage.get('k'), ' Buy some milk ')
+        self.assertEqual(storage.hget('task:1', 'title'), 'two\r\nlines')
+        self.assertEqual(storage.lrange('tasks', 0, -1), ['b', 'a'])
+
+        sync.cancel()
+        await replica.shutdown()
+        await self.master.aof_handler.fsync()
+        # Master and replica both persisted the same RESP frames.
+        for name in ('master', 'replica'):
+            with open(os.path.join(self.tmpdir.name, f'{name}.aof'), 'rb') as f:
+                self.assertEqual(f.read(), b''.join(commands), name)
+
+
+if __name__ == '__main__':
+    unittest.main()
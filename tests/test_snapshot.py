@@ -0,0 +1,133 @@
+"""Snapshot save/load round-trips for both servers."""
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import ignisdb_server
+from ignisdb.persistence import SnapshotHandler
+from ignisdb.storage import StorageEngine
+
+
+def fill(storage):
+    execute = storage.execute_command
+    execute(b'SET', [b'k', b'v'])
+    execute(b'SET', [b'bin', b'\xff\x00\xfe'])
+    execute(b'SET', [b'ttl', b'1', b'100'])
+    execute(b'LPUSH', [b'l', b'a', b'b'])
+    execute(b'HSET', [b'task:1', b'title', 'çay'.encode('utf-8')])
+
+
+class StandaloneSnapshotTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_storage(self, name):
+        return ignisdb_server.StorageEngine(os.path.join(self.tmpdir.name, name), aof_handler=None)
+
+    async def round_trip(self, name):
+        storage = self.make_storage(name)
+        fill(storage)
+        await storage.save_snapshot()
+
+        loaded = self.make_storage(name)
+        await loaded.load_from_snapshot()
+        return loaded
+
+    def assert_filled(self, storage):
+        execute = storage.execute_command
+        self.assertEqual(execute(b'GET', [b'k']), b'v')
+        self.assertEqual(execute(b'GET', [b'bin']), b'\xff\x00\xfe')
+        self.assertEqual(execute(b'GET', [b'ttl']), b'1')
+        self.assertIn(b'ttl', storage._expiry)
+        self.assertEqual(execute(b'LRANGE', [b'l', b'0', b'-1']), [b'b', b'a'])
+        self.assertEqual(execute(b'HGET', [b'task:1', b'title']), 'çay'.encode('utf-8'))
+
+    async def test_json_round_trip(self):
+        self.assert_filled(await self.round_trip('snapshot.json'))
+
+    @unittest.skipIf(ignisdb_server.msgpack is None, "msgpack is not installed")
+    async def test_msgpack_round_trip(self):
+        self.assert_filled(await self.round_trip('snapshot.msgpack'))
+
+    @unittest.skipIf(ignisdb_server.msgpack is None, "msgpack is not installed")
+    async def test_msgpack_path_falls_back_to_legacy_json(self):
+        storage = self.make_storage('snapshot.json')
+        fill(storage)
+        await storage.save_snapshot()
+
+        loaded = self.make_storage('snapshot.msgpack')
+        with self.assertLogs(level='WARNING') as logs:
+            await loaded.load_from_snapshot()
+        self.assertIn('legacy JSON snapshot', logs.output[0])
+        self.assert_filled(loaded)
+
+        # The next snapshot is written in the new format, after which it is preferred.
+        await loaded.save_snapshot()
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, 'snapshot.msgpack')))
+        loaded.execute_command(b'SET', [b'k', b'new'])
+        await loaded.save_snapshot()
+        reloaded = self.make_storage('snapshot.msgpack')
+        await reloaded.load_from_snapshot()
+        self.assertEqual(reloaded.execute_command(b'GET', [b'k']), b'new')
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "needs fork()")
+    async def test_child_logs_its_failure(self):
+        storage = self.make_storage('snapshot.json')
+        fill(storage)
+        log_path = os.path.join(self.tmpdir.name, 'child.log')
+        # The child logs through the handlers it inherits; a file handler makes that visible here.
+        handler = logging.FileHandler(log_path)
+        logging.getLogger().addHandler(handler)
+        try:
+            with mock.patch.object(storage, '_write_snapshot_file', side_effect=OSError("disk full")), \
+                    self.assertRaisesRegex(RuntimeError, "exited with status 1"):
+                await storage._save_snapshot_in_child()
+        finally:
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+        with open(log_path) as f:
+            log = f.read()
+        self.assertIn('Snapshot child process', log)
+        self.assertIn('OSError: disk full', log)
+
+    async def test_missing_snapshot_starts_empty(self):
+        storage = self.make_storage('missing.json')
+        await storage.load_from_snapshot()
+        self.assertIsNone(storage.execute_command(b'GET', [b'k']))
+
+
+class PackageSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'snapshot.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        storage = StorageEngine()
+        storage.set('k', 'v')
+        storage.set('ttl', '1', 100)
+        storage.lpush('l', ['a', 'b'])
+        storage.hset('task:1', 'title', 'çay')
+        SnapshotHandler(self.path).save(storage.get_all_data())
+
+        with open(self.path, encoding='utf-8') as f:
+            json.load(f)
+
+        loaded = StorageEngine()
+        loaded.load_data(SnapshotHandler(self.path).load())
+        self.assertEqual(loaded.get('k'), 'v')
+        self.assertEqual(loaded.get('ttl'), '1')
+        self.assertEqual(loaded.lrange('l', 0, -1), ['b', 'a'])
+        self.assertEqual(loaded.hget('task:1', 'title'), 'çay')
+
+
+if __name__ == '__main__':
+    unittest.main()
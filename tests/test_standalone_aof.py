@@ -0,0 +1,63 @@
+"""AOF buffering and close for the standalone server (ignisdb_server.py)."""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import ignisdb_server
+from ignisdb_server import AofHandler, encode_command
+
+
+class StandaloneAofTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'ignisdb.aof')
+        self.aof = AofHandler(self.path)
+        self.aof.open()
+
+    async def asyncTearDown(self):
+        await self.aof.close()
+        self.tmpdir.cleanup()
+
+    def read_file(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    async def test_close_writes_pending_commands(self):
+        self.aof.write_bytes(encode_command(b'SET', b'k', b'v'))
+        self.aof.write_many([encode_command(b'LPUSH', b'l', b'a'), encode_command(b'HSET', b'h', b'f', b'v')])
+        await self.aof.close()
+
+        self.assertEqual(self.read_file(), b''.join([
+            encode_command(b'SET', b'k', b'v'),
+            encode_command(b'LPUSH', b'l', b'a'),
+            encode_command(b'HSET', b'h', b'f', b'v'),
+        ]))
+
+    async def test_close_waits_for_fdatasync_in_flight(self):
+        synced = []
+
+        def slow_fdatasync(fd):
+            time.sleep(0.05)
+            os.fstat(fd)  # raises if the descriptor was closed underneath us
+            synced.append(fd)
+
+        with mock.patch.object(ignisdb_server, '_fdatasync', slow_fdatasync):
+            self.aof.write_bytes(encode_command(b'SET', b'k', b'v'))
+            self.aof.flush()
+            self.aof._sync()
+            future = self.aof._fsync_future
+            self.assertIsNotNone(future)
+
+            await self.aof.close()
+            self.assertTrue(future.done())
+            self.assertIsNone(future.exception())
+            self.assertEqual(len(synced), 2)
+
+        self.assertEqual(self.read_file(), encode_command(b'SET', b'k', b'v'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+"""Expiration against the cached clock of the package storage engine (ignisdb/)."""
+import unittest
+from unittest import mock
+
+from ignisdb import storage as storage_module
+from ignisdb.storage import StorageEngine
+
+
+class CachedClockTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(storage_module.time, 'time', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = StorageEngine()
+
+    def test_commands_use_the_cached_clock(self):
+        self.storage.set('k', 'v', 10)
+        self.assertEqual(self.storage._expiry['k'], 1010.0)
+
+        self.clock.return_value = 1011.0
+        # Still inside the same batch: the clock has not been refreshed yet.
+        self.assertEqual(self.storage.get('k'), 'v')
+        self.storage.refresh_clock()
+        self.assertIsNone(self.storage.get('k'))
+
+    def test_expire_and_snapshot_prune(self):
+        self.storage.set('a', '1')
+        self.storage.set('b', '2')
+        self.assertEqual(self.storage.expire('a', 5), 1)
+        self.assertEqual(self.storage._expiry['a'], 1005.0)
+
+        # get_all_data reads the clock itself, as it runs outside any batch.
+        self.clock.return_value = 1006.0
+        self.assertEqual(self.storage.get_all_data(), {'b': ('string', '2', None)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+"""Runs the todo app's IgnisDB client against both servers in this repo."""
+import argparse
+import asyncio
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import ignisdb_server
+from ignisdb.server import IgnisServer
+
+HAS_WEBSOCKETS = importlib.util.find_spec('websockets') is not None
+if HAS_WEBSOCKETS:
+    import todo_server
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TodoServerCopiesTest(unittest.TestCase):
+    def test_copies_are_identical(self):
+        with open(os.path.join(ROOT, 'todo_server.py'), 'rb') as f:
+            root_copy = f.read()
+        with open(os.path.join(ROOT, 'examples', 'todo-app', 'todo_server.py'), 'rb') as f:
+            example_copy = f.read()
+        self.assertEqual(root_copy, example_copy)
+
+
+class TodoClientTests:
+    """Test cases shared by every server; subclasses provide start_server()."""
+
+    async def start_server(self):
+        """Returns the client_connected_cb of an IgnisDB server using self.tmpdir."""
+        raise NotImplementedError
+
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        handle_client = await self.start_server()
+        self.handlers = []
+
+        async def track(reader, writer):
+            self.handlers.append(asyncio.current_task())
+            await handle_client(reader, writer)
+
+        self.listener = await asyncio.start_server(track, '127.0.0.1', 0)
+        port = self.listener.sockets[0].getsockname()[1]
+
+        self.todo = todo_server.TodoServer(ignis_host='127.0.0.1', ignis_port=port)
+        await self.todo.initialize()
+
+    async def asyncTearDown(self):
+        await self.todo.db_client.close()
+        await asyncio.gather(*self.handlers)
+        self.listener.close()
+        await self.listener.wait_closed()
+        self.tmpdir.cleanup()
+
+    async def test_load_tasks_empty(self):
+        self.assertEqual(await self.todo.load_tasks(), [])
+
+    async def test_save_and_load_tasks(self):
+        await self.todo.save_task({'id': 't1', 'title': 'Milk', 'status': 'todo', 'priority': 2})
+        await self.todo.save_task({'id': 't2', 'title': 'Bread', 'status': 'done', 'assignee': 'sam'})
+
+        tasks = await self.todo.load_tasks()
+        self.assertEqual([task['id'] for task in tasks], ['t2', 't1'])
+        self.assertEqual(tasks[0]['title'], 'Bread')
+        self.assertEqual(tasks[0]['assignee'], 'sam')
+        self.assertEqual(tasks[1]['priority'], '2')
+        self.assertIsNone(tasks[1]['assignee'])
+
+    async def test_load_task(self):
+        await self.todo.save_task({'id': 't1', 'title': 'Milk', 'status': 'todo'})
+        task = await self.todo.load_task('t1')
+        self.assertEqual(task['title'], 'Milk')
+        self.assertEqual(task['status'], 'todo')
+        self.assertIsNone(await self.todo.load_task('missing'))
+
+    async def test_load_tasks_skips_wrong_type(self):
+        await self.todo.save_task({'id': 't1', 'title': 'Milk'})
+        await self.todo.db_client.send_command("LPUSH", "tasks:list", "t2")
+        await self.todo.db_client.send_command("SET", "task:t2", "1")
+
+        tasks = await self.todo.load_tasks()
+        self.assertEqual([task['id'] for task in tasks], ['t1'])
+
+    async def test_hmget_wrong_type(self):
+        await self.todo.db_client.send_command("SET", "plain", "1")
+        reply = await self.todo.db_client.send_command("HMGET", "plain", "title")
+        self.assertIsInstance(reply, todo_server.IgnisDBError)
+        self.assertIn("WRONGTYPE", str(reply))
+
+    async def test_values_round_trip_intact(self):
+        titles = ['Buy some milk', '  padded  ', 'two\r\nlines', 'Çay ve süt', '*1\r\n$3\r\nGET']
+        for i, title in enumerate(titles):
+            await self.todo.save_task({'id': f't{i}', 'title': title})
+        for i, title in enumerate(titles):
+            self.assertEqual((await self.todo.load_task(f't{i}'))['title'], title)
+
+        replies = await self.todo.db_client.pipeline([('SET', 'k', ' a b '), ('GET', 'k')])
+        self.assertEqual(replies, ['OK', ' a b '])
+
+
+@unittest.skipUnless(HAS_WEBSOCKETS, "todo_server needs websockets")
+class PackageServerTest(TodoClientTests, unittest.IsolatedAsyncioTestCase):
+    """The package server started by main.py."""
+
+    async def start_server(self):
+        self.ignis = IgnisServer(
+            host='127.0.0.1', port=0, persistence_mode='snapshot',
+            snapshot_path=os.path.join(self.tmpdir.name, 'snapshot.json'),
+            aof_path=os.path.join(self.tmpdir.name, 'ignisdb.aof'),
+            snapshot_interval=0,
+        )
+        await self.ignis.initialize()
+        return self.ignis.handle_client
+
+
+@unittest.skipUnless(HAS_WEBSOCKETS, "todo_server needs websockets")
+class PackageServerWithoutHmgetTest(PackageServerTest):
+    """A server that predates HMGET: the client falls back to HGET."""
+
+    async def start_server(self):
+        handle_client = await super().start_server()
+        del self.ignis.command_handlers['HMGET']
+        return handle_client
+
+    async def test_hmget_wrong_type(self):
+        reply = await self.todo.db_client.send_command("HMGET", "plain", "title")
+        self.assertTrue(todo_server._is_unknown_command(reply))
+
+    async def test_falls_back_to_hget(self):
+        await self.todo.save_task({'id': 't1', 'title': 'Milk'})
+        self.assertEqual((await self.todo.load_task('t1'))['title'], 'Milk')
+        self.assertFalse(self.todo._use_hmget)
+
+
+@unittest.skipUnless(HAS_WEBSOCKETS, "todo_server needs websockets")
+class StandaloneServerTest(TodoClientTests, unittest.IsolatedAsyncioTestCase):
+    """The single-file server in ignisdb_server.py."""
+
+    async def start_server(self):
+        storage = ignisdb_server.StorageEngine(
+            snapshot_path=os.path.join(self.tmpdir.name, 'snapshot.json'), aof_handler=None)
+        protocol = ignisdb_server.ProtocolHandler()
+        repl_manager = ignisdb_server.ReplicationManager('master', storage, protocol, argparse.Namespace())
+        return lambda r, w: ignisdb_server.handle_client(r, w, storage, protocol, repl_manager)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+"""Key routing between shards of the standalone server run with --workers."""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import zlib
+
+import ignisdb_server
+from ignisdb_server import MovedError, ShardMap, encode_command
+from test_todo_client import HAS_WEBSOCKETS, TodoClientTests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = '127.0.0.1'
+
+
+def free_port_range(count):
+    """Returns the first of `count` consecutive ports that are free right now."""
+    for _ in range(100):
+        base = random.randrange(20000, 60000 - count)
+        sockets = []
+        try:
+            for port in range(base, base + count):
+                sock = socket.socket()
+                sockets.append(sock)
+                sock.bind((HOST, port))
+            return base
+        except OSError:
+            continue
+        finally:
+            for sock in sockets:
+                sock.close()
+    raise RuntimeError("no free port range found")
+
+
+def key_for(worker_id, workers=2, prefix='k'):
+    """Returns a key that worker_id owns."""
+    for i in range(1000):
+        key = f'{prefix}{i}'.encode()
+        if zlib.crc32(key) % workers == worker_id:
+            return key
+    raise AssertionError("no key found")
+
+
+class ShardMapTest(unittest.TestCase):
+    def test_owner_is_stable(self):
+        shard_map = ShardMap(0, 4, HOST, 7000)
+        for key in (b'a', b'task:1', b'tasks:list'):
+            self.assertEqual(shard_map.owner(key), zlib.crc32(key) % 4)
+
+    def test_check_moves_foreign_keys(self):
+        shard_map = ShardMap(0, 2, HOST, 7000)
+        shard_map.check(key_for(0))
+        with self.assertRaisesRegex(MovedError, f"^MOVED 1 {HOST}:7001$"):
+            shard_map.check(key_for(1))
+
+
+class Workers:
+    """Two in-process workers, each with its own storage and own port, as --workers 2 runs them."""
+
+    def __init__(self, tmpdir):
+        self.tmpdir = tmpdir
+        self.handlers = []
+        self.servers = []
+        self.shard_maps = []
+        self.storages = []
+
+    def handler(self, worker_id):
+        storage, shard_map = self.storages[worker_id], self.shard_maps[worker_id]
+        protocol = ignisdb_server.ProtocolHandler()
+        repl_manager = ignisdb_server.ReplicationManager('master', storage, protocol, argparse.Namespace())
+
+        async def handle(reader, writer):
+            self.handlers.append(asyncio.current_task())
+            await ignisdb_server.handle_client(reader, writer, storage, protocol, repl_manager, shard_map)
+        return handle
+
+    async def start(self, workers=2):
+        self.base = free_port_range(workers)
+        for worker_id in range(workers):
+            self.storages.append(ignisdb_server.StorageEngine(
+                os.path.join(self.tmpdir, f'snapshot.{worker_id}.json'), aof_handler=None))
+            self.shard_maps.append(ShardMap(worker_id, workers, HOST, self.base))
+        for worker_id in range(workers):
+            self.servers.append(await asyncio.start_server(self.handler(worker_id), HOST, self.base + worker_id))
+
+    async def stop(self):
+        for shard_map in self.shard_maps:
+            await shard_map.close()
+        await asyncio.gather(*self.handlers)
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+
+class ForwardingTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.workers = Workers(self.tmpdir.name)
+        await self.workers.start()
+        self.reader, self.writer = await asyncio.open_connection(HOST, self.workers.base)
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.workers.stop()
+        self.tmpdir.cleanup()
+
+    async def send(self, *commands):
+        self.writer.write(b''.join(encode_command(*command) for command in commands))
+        await self.writer.drain()
+        return [await ignisdb_server._read_reply_frame(self.reader) for _ in commands]
+
+    async def test_foreign_keys_are_forwarded(self):
+        local, foreign = key_for(0), key_for(1)
+        replies = await self.send(
+            (b'SET', local, b'here'),
+            (b'SET', foreign, b'there'),
+            (b'LPUSH', b'tasks:list', b't1', b't2'),
+            (b'HSET', b'task:t1', b'title', b'Buy some milk'),
+            (b'GET', local),
+            (b'GET', foreign),
+            (b'HMGET', b'task:t1', b'title', b'missing'),
+            (b'LRANGE', b'tasks:list', b'0', b'-1'),
+            (b'GET', key_for(1, prefix='none')),
+            (b'HGET', foreign, b'f'),
+        )
+        self.assertEqual(replies, [
+            b'+OK\r\n',
+            b'+OK\r\n',
+            b':2\r\n',
+            b':1\r\n',
+            b'$4\r\nhere\r\n',
+            b'$5\r\nthere\r\n',
+            b'*2\r\n$13\r\nBuy some milk\r\n_(nil)\r\n',
+            b'*2\r\n$2\r\nt2\r\n$2\r\nt1\r\n',
+            b'_(nil)\r\n',
+            b'-WRONGTYPE Operation against a key holding the wrong kind of value\r\n',
+        ])
+        # Each key is stored only on the worker that owns it.
+        storages = self.workers.storages
+        self.assertEqual(storages[1].execute_command(b'GET', [foreign]), b'there')
+        self.assertNotIn(foreign, storages[0]._strings)
+        self.assertNotIn(local, storages[1]._strings)
+
+    async def test_moved_inside_multi(self):
+        local, foreign = key_for(0), key_for(1)
+        replies = await self.send(
+            (b'MULTI',), (b'SET', local, b'1'), (b'SET', foreign, b'2'), (b'EXEC',),
+            (b'GET', local),
+        )
+        self.assertEqual(replies, [
+            b'+OK\r\n',
+            b'+QUEUED\r\n',
+            b'-MOVED 1 %s:%d\r\n' % (HOST.encode(), self.workers.base + 1),
+            b'-ERR EXECABORT Transaction discarded because of previous errors.\r\n',
+            b'_(nil)\r\n',
+        ])
+
+        replies = await self.send((b'MULTI',), (b'SET', local, b'1'), (b'EXEC',))
+        self.assertEqual(replies, [b'+OK\r\n', b'+QUEUED\r\n', b'*1\r\n+OK\r\n'])
+
+    async def test_unreachable_worker(self):
+        server = self.workers.servers[1]
+        server.close()
+        await server.wait_closed()
+        reply, = await self.send((b'GET', key_for(1)))
+        self.assertTrue(reply.startswith(b'-ERR worker 1 is unreachable'), reply)
+
+
+@unittest.skipUnless(HAS_WEBSOCKETS, "todo_server needs websockets")
+class WorkersTodoClientTest(TodoClientTests, unittest.IsolatedAsyncioTestCase):
+    """The todo client against the shared port of two workers: no key is refused."""
+
+    async def start_server(self):
+        self.workers = Workers(self.tmpdir.name)
+        await self.workers.start()
+        return self.workers.handler(0)
+
+    async def asyncTearDown(self):
+        await self.todo.db_client.close()
+        await self.workers.stop()
+        await super().asyncTearDown()
+
+
+@unittest.skipUnless(hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT'), "needs fork() and SO_REUSEPORT")
+class WorkerProcessesTest(unittest.TestCase):
+    """Runs ignisdb_server.py --workers 2 for real, including the forked snapshot of each shard."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.port = free_port_range(1)
+        self.base = free_port_range(2)
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'ignisdb_server.py'), '--port', str(self.port),
+             '--workers', '2', '--worker-port-base', str(self.base),
+             '--snapshot-file', 'dump.json', '--snapshot-interval', '1'],
+            cwd=self.tmpdir.name, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.addCleanup(self.stop)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+    def connect(self, port):
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                return socket.create_connection((HOST, port), timeout=5)
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def command(self, sock, *parts):
+        sock.sendall(encode_command(*parts))
+        reply = b''
+        while not reply.endswith(b'\r\n'):
+            reply += sock.recv(4096)
+        return reply
+
+    def test_routing_and_shard_snapshots(self):
+        for worker_id in range(2):
+            self.connect(self.base + worker_id).close()
+        keys = [key_for(worker_id, prefix=prefix) for worker_id in range(2) for prefix in ('a', 'b')]
+        # Every connection to the shared port may land on either worker.
+        for key in keys:
+            with self.connect(self.port) as sock:
+                self.assertEqual(self.command(sock, b'SET', key, b'v-' + key), b'+OK\r\n')
+        for key in keys:
+            with self.connect(self.port) as sock:
+                self.assertEqual(self.command(sock, b'GET', key), b'$%d\r\nv-%s\r\n' % (len(key) + 2, key))
+
+        # The periodic snapshot is written by a forked child of each worker, one file per shard.
+        paths = [os.path.join(self.tmpdir.name, f'dump.{worker_id}.json') for worker_id in range(2)]
+        deadline = time.monotonic() + 10
+        while not all(os.path.exists(path) for path in paths):
+            self.assertLess(time.monotonic(), deadline, "shard snapshots were not written")
+            time.sleep(0.1)
+        time.sleep(1.5)  # one more interval, so the files hold the writes above
+        for worker_id, path in enumerate(paths):
+            with open(path, encoding='utf-8') as f:
+                stored = sorted(json.load(f))
+            self.assertEqual(stored, sorted(key.decode() for key in keys if zlib.crc32(key) % 2 == worker_id))
+
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(self.process.wait(timeout=10), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
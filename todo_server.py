@@ -1,11 +1,16 @@
 """
 Real-Time Collaborative Todo Manager - WebSocket Server
 Bridges browser clients to IgnisDB backend via WebSocket
+
+This file exists twice, as todo_server.py at the repository root and as
+examples/todo-app/todo_server.py, so the example runs from its own directory.
+The two copies are duplicates and must be kept identical (tests/test_todo_client.py
+checks this).
 """
 import asyncio
 import json
 import logging
-from typing import Set
+from typing import Any, Set
 from datetime import datetime
 
 # Simple WebSocket server
@@ -17,6 +22,52 @@ except ImportError:
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Hash fields stored for every task under task:<id>
+TASK_FIELDS = ('title', 'status', 'assignee', 'priority', 'dueDate', 'createdBy', 'createdAt')
+
+class IgnisDBError(Exception):
+    """An error reply (-ERR ...) sent by IgnisDB."""
+
+def _is_unknown_command(reply) -> bool:
+    """True for the error reply IgnisDB sends for a command it does not implement."""
+    return isinstance(reply, IgnisDBError) and 'unknown command' in str(reply).lower()
+
+class RESPReader:
+    """
+    Reads one complete RESP reply at a time from a stream.
+    Bulk strings are read by their declared length, so values containing
+    CRLF or spanning several TCP segments are returned intact.
+    """
+    def __init__(self, reader: asyncio.StreamReader):
+        self.reader = reader
+
+    async def read_reply(self) -> Any:
+        line = await self.reader.readuntil(b'\r\n')
+        prefix, body = line[:1], line[1:-2]
+
+        if prefix == b'$':
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2].decode('utf-8')
+        if prefix == b'*':
+            count = int(body)
+            if count < 0:
+                return None
+            return [await self.read_reply() for _ in range(count)]
+        if prefix == b'+':
+            return body.decode('utf-8')
+        if prefix == b':':
+            return int(body)
+        if prefix == b'-':
+            return IgnisDBError(body.decode('utf-8'))
+        if prefix == b'_':
+            # IgnisDB sends nil as "_(nil)"
+            return None
+
+        raise IgnisDBError(f"Unexpected RESP reply: {line[:50]!r}")
+
 class IgnisDBClient:
     """TCP client to communicate with IgnisDB server"""
     def __init__(self, host='127.0.0.1', port=6380):
@@ -24,26 +75,63 @@ class IgnisDBClient:
         self.port = port
         self.reader = None
         self.writer = None
+        self._resp = None
+        # Scratch buffer commands are encoded into; reused for every send.
+        self._out = bytearray()
+        # Replies are matched to commands by order, so one command is in flight at a time.
+        self._lock = asyncio.Lock()
 
     async def connect(self):
         self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self._resp = RESPReader(self.reader)
         logging.info(f"Connected to IgnisDB at {self.host}:{self.port}")
 
-    async def send_command(self, command: str, *args) -> str:
-        cmd_str = f"{command} {' '.join(map(str, args))}\n"
-
-        logging.debug(f"Sending to IgnisDB: {cmd_str.strip()}")
-
-        self.writer.write(cmd_str.encode('utf-8'))
+    def _encode_command(self, command: str, args):
+        """
+        Appends the command to the scratch buffer as a RESP array. Every argument is
+        length-prefixed, so values with spaces, CRLF or leading/trailing blanks arrive intact.
+        """
+        out = self._out
+        encoded = command.encode('utf-8')
+        out += b'*%d\r\n$%d\r\n%s\r\n' % (len(args) + 1, len(encoded), encoded)
+        for arg in args:
+            encoded = str(arg).encode('utf-8')
+            out += b'$%d\r\n%s\r\n' % (len(encoded), encoded)
+
+    async def _flush(self):
+        out = self._out
+        self.writer.write(bytes(out))
+        out.clear()
         await self.writer.drain()
 
-        # Read response (IgnisDB sends responses ending with \r\n)
-        data = await self.reader.read(4096)
-        response = data.decode('utf-8').strip()
+    async def send_command(self, command: str, *args) -> Any:
+        """Sends a command and returns its parsed reply (str, int, list, None or IgnisDBError)."""
+        logging.debug(f"Sending to IgnisDB: {command} {' '.join(map(str, args))}")
+
+        async with self._lock:
+            self._encode_command(command, args)
+            await self._flush()
+            response = await self._resp.read_reply()
 
-        logging.debug(f"Received from IgnisDB: {response}")
+        logging.debug(f"Received from IgnisDB: {response!r}")
         return response
 
+    async def pipeline(self, commands) -> list:
+        """
+        Sends several (command, *args) tuples in one write and returns their replies in order.
+        The whole batch costs a single round-trip instead of one per command.
+        """
+        logging.debug(f"Pipelining {len(commands)} commands to IgnisDB")
+
+        async with self._lock:
+            for command, *args in commands:
+                self._encode_command(command, args)
+            await self._flush()
+            responses = [await self._resp.read_reply() for _ in commands]
+
+        logging.debug(f"Received from IgnisDB: {responses!r}")
+        return responses
+
     async def close(self):
         if self.writer:
             self.writer.close()
@@ -55,6 +143,8 @@ class TodoServer:
         self.ignis_port = ignis_port
         self.clients: Set[websockets.WebSocketServerProtocol] = set()
         self.db_client = None
+        # Cleared the first time IgnisDB rejects HMGET; tasks are then read field by field.
+        self._use_hmget = True
 
     async def initialize(self):
         self.db_client = IgnisDBClient(self.ignis_host, self.ignis_port)
@@ -82,21 +172,21 @@ class TodoServer:
     async def load_tasks(self) -> list:
         """Load all tasks from IgnisDB"""
         try:
-            response = await self.db_client.send_command("LRANGE", "tasks:list", "0", "-1")
+            task_ids = await self.db_client.send_command("LRANGE", "tasks:list", "0", "-1")
 
-            if response == "*0\r\n" or response == "_(nil)\r\n" or not response or response == "*0":
+            if isinstance(task_ids, IgnisDBError):
+                logging.warning(f"Error response from IgnisDB: {task_ids}")
+                return []
+
+            if not task_ids:
                 logging.info("No tasks found in database")
                 return []
 
-            # Parse the RESP array
-            task_ids = self._parse_resp_array(response)
             logging.info(f"Found {len(task_ids)} task IDs: {task_ids}")
 
-            tasks = []
-            for task_id in task_ids:
-                task = await self.load_task(task_id)
-                if task:
-                    tasks.append(task)
+            replies = await self._fetch_tasks(task_ids)
+            loaded = (self._build_task(task_id, values) for task_id, values in zip(task_ids, replies))
+            tasks = [task for task in loaded if task]
 
             logging.info(f"Successfully loaded {len(tasks)} tasks")
             return tasks
@@ -104,129 +194,57 @@ class TodoServer:
             logging.error(f"Error loading tasks: {e}")
             return []
 
-    def _parse_resp_array(self, response: str) -> list:
-        """Parse RESP array format: *<count>\r\n$<len1>\r\n<val1>\r\n... """
-        items = []
-        lines = response.split('\r\n')
-
-        if not lines or not lines[0].startswith('*'):
-            logging.warning(f"Invalid RESP array format: {response[:50]}")
-            return items
-
-        try:
-            count = int(lines[0][1:])
-            logging.debug(f"Parsing RESP array with {count} items")
-        except ValueError:
-            logging.error(f"Invalid array count in RESP: {lines[0]}")
-            return items
-
-        # Skip the first line (*<count>) and process pairs of ($<len>, <value>)
-        i = 1
-        while i < len(lines) - 1 and len(items) < count:
-            current_line = lines[i]
-            if current_line.startswith('$'):
-                try:
-                    length = int(current_line[1:])
-
-                    # Check for nil response
-                    if length == -1:
-                        items.append(None)
-                        i += 1
-                        continue
-
-                    # The next line should be the actual value
-                    if i + 1 < len(lines):
-                        value = lines[i + 1]
-                        # Validate that the length matches (or is close, accounting for encoding)
-                        if len(value) == length or abs(len(value) - length) <= 2:
-                            items.append(value)
-                            logging.debug(f"Parsed item: {value}")
-                        else:
-                            logging.warning(f"Length mismatch: expected {length}, got {len(value)} for '{value}'")
-                            items.append(value)
-                    i += 2  # Skip both the $-line and the value line
-                except ValueError as e:
-                    logging.error(f"Error parsing RESP line '{current_line}': {e}")
-                    i += 1
-            else:
-                i += 1
-
-        logging.debug(f"Parsed {len(items)} items from RESP array")
-        return items
-
     async def load_task(self, task_id: str) -> dict:
         """Load a single task from IgnisDB"""
         try:
-            fields = ['title', 'status', 'assignee', 'priority', 'dueDate', 'createdBy', 'createdAt']
-            task = {'id': task_id}
-
-            for field in fields:
-                response = await self.db_client.send_command("HGET", f"task:{task_id}", field)
-                logging.debug(f"HGET task:{task_id} {field}: {repr(response)}")
-
-                # Parse response
-                value = self._parse_resp_string(response)
-                task[field] = value
-
-                if value:
-                    logging.debug(f"Loaded field {field} = {value}")
-
-            if task.get('title'):
-                logging.info(f"Successfully loaded task {task_id}: {task.get('title')}")
-                return task
-            else:
-                logging.warning(f"Task {task_id} has no title, skipping")
-                return None
-
+            values, = await self._fetch_tasks([task_id])
+            return self._build_task(task_id, values)
         except Exception as e:
             logging.error(f"Error loading task {task_id}: {e}")
             return None
 
-    def _parse_resp_string(self, response: str) -> str:
-        """Parse RESP bulk string format: $<len>\r\n<value>\r\n or _(nil)\r\n"""
-        if not response:
+    async def _fetch_tasks(self, task_ids) -> list:
+        """
+        Fetch TASK_FIELDS for each task in a single pipelined round-trip.
+        Sends one HMGET per task, or one HGET per field on servers without HMGET.
+        Each entry is the list of field values, or the IgnisDBError the task's lookup failed with.
+        """
+        if self._use_hmget:
+            cmds = [("HMGET", f"task:{task_id}", *TASK_FIELDS) for task_id in task_ids]
+            replies = await self.db_client.pipeline(cmds)
+            if not _is_unknown_command(replies[0]):
+                return replies
+            logging.info("IgnisDB does not support HMGET, falling back to HGET")
+            self._use_hmget = False
+
+        cmds = [("HGET", f"task:{task_id}", field) for task_id in task_ids for field in TASK_FIELDS]
+        replies = await self.db_client.pipeline(cmds)
+        n = len(TASK_FIELDS)
+        results = []
+        for i in range(0, len(replies), n):
+            values = replies[i:i + n]
+            error = next((value for value in values if isinstance(value, IgnisDBError)), None)
+            results.append(error or values)
+        return results
+
+    def _build_task(self, task_id: str, values) -> dict:
+        """Build a task dict from the field values fetched over TASK_FIELDS"""
+        logging.debug(f"task:{task_id} fields: {repr(values)}")
+
+        if isinstance(values, IgnisDBError):
+            logging.warning(f"Error response from IgnisDB: {values}")
             return None
 
-        response = response.strip()
-
-        # Check for nil response
-        if response == "_(nil)" or response == "_(nil)\r\n":
-            return None
+        task = {'id': task_id}
+        task.update(zip(TASK_FIELDS, values))
 
-        # Parse bulk string format
-        if response.startswith('$'):
-            lines = response.split('\r\n')
-            if len(lines) >= 2:
-                length_line = lines[0]
-                try:
-                    length = int(length_line[1:])
-
-                    # Check for nil ($-1)
-                    if length == -1:
-                        return None
-
-                    if len(lines) > 1:
-                        return lines[1]
-                except ValueError:
-                    logging.error(f"Invalid bulk string length: {length_line}")
-                    return None
-
-        # If it starts with '-', it's an error
-        if response.startswith('-'):
-            logging.warning(f"Error response from IgnisDB: {response}")
+        if task.get('title'):
+            logging.info(f"Successfully loaded task {task_id}: {task.get('title')}")
+            return task
+        else:
+            logging.warning(f"Task {task_id} has no title, skipping")
             return None
 
-        # If it starts with '+', it's a simple string
-        if response.startswith('+'):
-            return response[1:]
-
-        # If it starts with ':', it's an integer
-        if response.startswith(':'):
-            return response[1:]
-
-        logging.warning(f"Unexpected RESP format: {response[:50]}")
-        return response
-
     async def save_task(self, task: dict):
         """Save a task to IgnisDB"""
         task_id = task['id']